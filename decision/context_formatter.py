@@ -3,13 +3,49 @@ Context Formatter for K-Fix MVP
 Formats and validates context bundles for LLM processing
 """
 
+import heapq
 import logging
+from collections import Counter
+from functools import cache
 from typing import Dict, Any, List, Optional
 from datetime import datetime
-import json
+import orjson
+
+from .prompt_templates import TOKENIZER_MODEL
 
 logger = logging.getLogger(__name__)
 
+# Clé de tag ("clé:valeur") → catégorie du résumé; les clés Datadog kube_* / pod_name
+# sont celles réellement envoyées par l'agent
+_TAG_BUCKETS = {
+    "service": "service_tags",
+    "env": "env_tags",
+    "pod": "k8s_tags",
+    "deployment": "k8s_tags",
+    "namespace": "k8s_tags",
+    "pod_name": "k8s_tags",
+    "kube_namespace": "k8s_tags",
+    "kube_deployment": "k8s_tags",
+}
+
+def _event_timestamp(event: Dict[str, Any]) -> str:
+    """Sort key for events (missing/None timestamps sort last)"""
+    return event.get("timestamp") or ""
+
+def _name_key(item: Dict[str, Any]) -> str:
+    """Sort key for pods / deployments (missing names sort first)"""
+    return item.get("name") or ""
+
+@cache
+def _get_token_encoder():
+    """Encodeur tiktoken du modèle, chargé une seule fois (None si indisponible)"""
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model(TOKENIZER_MODEL)
+    except Exception as e:
+        logger.warning(f"⚠️ tiktoken unavailable ({e}), estimating tokens as chars / 4")
+        return None
+
 class ContextFormatter:
     """
     Formats context bundles for optimal LLM processing
@@ -17,7 +53,7 @@ class ContextFormatter:
     """
     
     def __init__(self):
-        self.max_context_size = 8000  # characters
+        self.max_context_tokens = 2000  # tokens (≈ les 8000 caractères de l'ancien budget)
         self.max_events = 10
         self.max_metrics = 15
         
@@ -40,11 +76,11 @@ class ContextFormatter:
         formatted_context = {
             "event_context": self._format_event_context(enriched_data.get("event_details", {})),
             "k8s_context": self._format_k8s_context(enriched_data.get("k8s_context", {})),
-            "metadata": self._create_metadata(enriched_data)
+            "metadata": self._create_metadata(enriched_data, datetime.now().isoformat())
         }
         
         # Compress if too large
-        if self._calculate_context_size(formatted_context) > self.max_context_size:
+        if self._count_tokens(formatted_context) > self.max_context_tokens:
             logger.warning("⚠️ Context too large, applying compression")
             formatted_context = self._compress_context(formatted_context)
         
@@ -106,14 +142,17 @@ class ContextFormatter:
             "tags": event_response.data.attributes.tags or []
         }
         """
+        timestamp = event_details.get("timestamp")
+        # Ordre canonique: mêmes tags dans un autre ordre → même prompt (cache de prompt)
+        tags = sorted(event_details.get("tags") or [])
         return {
             "event_id": event_details.get("event_id"),
             "title": event_details.get("title", ""),
             "message": self._truncate_text(event_details.get("message", ""), 500),
-            "timestamp": event_details.get("timestamp"),
-            "tags": event_details.get("tags", []),
-            "formatted_timestamp": self._format_timestamp(event_details.get("timestamp")),
-            "tag_summary": self._extract_tag_summary(event_details.get("tags", []))
+            "timestamp": timestamp,
+            "tags": tags,
+            "formatted_timestamp": self._format_timestamp(timestamp),
+            "tag_summary": self._extract_tag_summary(tags)
         }
     
     def _format_k8s_context(self, k8s_context: Dict[str, Any]) -> Dict[str, Any]:
@@ -121,10 +160,17 @@ class ContextFormatter:
         if not k8s_context:
             return {}
         
+        # Pods et déploiements triés par nom: l'ordre renvoyé par l'API ne change pas le prompt
         formatted_k8s = {
             "namespace": k8s_context.get("namespace"),
-            "pods": [self._format_pod_info(pod) for pod in k8s_context.get("pods", [])],
-            "deployments": [self._format_deployment_info(dep) for dep in k8s_context.get("deployments", [])],
+            "pods": sorted(
+                (self._format_pod_info(pod) for pod in k8s_context.get("pods", [])),
+                key=_name_key
+            ),
+            "deployments": sorted(
+                (self._format_deployment_info(dep) for dep in k8s_context.get("deployments", [])),
+                key=_name_key
+            ),
             "events": self._format_events(k8s_context.get("events", []))
         }
         
@@ -166,67 +212,101 @@ class ContextFormatter:
         if not events:
             return []
         
-        # Sort by timestamp (most recent first) and limit
-        sorted_events = sorted(
-            events, 
-            key=lambda x: x.get("timestamp", ""), 
-            reverse=True
-        )[:self.max_events]
+        # Most recent first, limited: partial selection O(N log k) instead of a full sort
+        sorted_events = heapq.nlargest(self.max_events, events, key=_event_timestamp)
         
-        formatted_events = []
-        for event in sorted_events:
-            formatted_events.append({
+        return [
+            {
                 "type": event.get("type"),
                 "reason": event.get("reason"),
                 "message": self._truncate_text(event.get("message", ""), 200),
                 "timestamp": event.get("timestamp"),
                 "object": event.get("object"),
                 "count": event.get("count", 1)
-            })
-        
-        return formatted_events
+            }
+            for event in sorted_events
+        ]
     
 
     
-    def _create_metadata(self, enriched_data: Dict[str, Any]) -> Dict[str, Any]:
+    def _create_metadata(self, enriched_data: Dict[str, Any], formatted_at: str) -> Dict[str, Any]:
         """Create metadata about the enriched data"""
         return {
-            "formatted_at": datetime.now().isoformat(),
+            "formatted_at": formatted_at,
             "data_sources": list(enriched_data.keys()),
             "enrichment_status": enriched_data.get("enrichment_status"),
             "processing_time": enriched_data.get("processing_time"),
-            "estimated_size": self._calculate_context_size(enriched_data)
+            "estimated_size": self._estimate_size(enriched_data)
         }
     
     def _compress_context(self, context: Dict[str, Any]) -> Dict[str, Any]:
-        """Compress context if it's too large"""
+        """Compress context step by step, stopping as soon as it fits the token budget"""
         compressed = context.copy()
         
         # Reduce number of events
         if "k8s_context" in compressed and "events" in compressed["k8s_context"]:
             compressed["k8s_context"]["events"] = compressed["k8s_context"]["events"][:5]
+            if self._count_tokens(compressed) <= self.max_context_tokens:
+                return compressed
         
         # Truncate long messages
         if "event_context" in compressed and "message" in compressed["event_context"]:
             compressed["event_context"]["message"] = self._truncate_text(
                 compressed["event_context"]["message"], 300
             )
+            if self._count_tokens(compressed) <= self.max_context_tokens:
+                return compressed
+        
+        # Squeeze event messages (duplicate lines / repeated stack frames)
+        if "k8s_context" in compressed and "events" in compressed["k8s_context"]:
+            compressed["k8s_context"]["events"] = [
+                {**event, "message": self._squeeze_text(event.get("message"))}
+                for event in compressed["k8s_context"]["events"]
+            ]
+            if self._count_tokens(compressed) <= self.max_context_tokens:
+                return compressed
         
         # Reduce pod details if still too large
-        if self._calculate_context_size(compressed) > self.max_context_size:
-            if "k8s_context" in compressed and "pods" in compressed["k8s_context"]:
-                for pod in compressed["k8s_context"]["pods"]:
-                    if "containers" in pod:
-                        pod["containers"] = pod["containers"][:3]  # Keep only first 3 containers
+        if "k8s_context" in compressed and "pods" in compressed["k8s_context"]:
+            for pod in compressed["k8s_context"]["pods"]:
+                if "containers" in pod:
+                    pod["containers"] = pod["containers"][:3]  # Keep only first 3 containers
         
         return compressed
     
-    def _calculate_context_size(self, context: Dict[str, Any]) -> int:
-        """Calculate approximate context size in characters"""
+    def _estimate_size(self, obj: Any) -> int:
+        """Approximate JSON size in characters: one walk over the structure, no serialization"""
+        size = 0
+        stack = [obj]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, dict):
+                size += 2
+                for key, value in item.items():
+                    size += len(str(key)) + 6  # '"key": ' + séparateur ", "
+                    stack.append(value)
+            elif isinstance(item, (list, tuple)):
+                size += 2 + 2 * len(item)
+                stack.extend(item)
+            elif isinstance(item, str):
+                size += len(item) + 2
+            elif item is None:
+                size += 4
+            else:
+                size += len(str(item))
+        return size
+    
+    def _count_tokens(self, context: Dict[str, Any]) -> int:
+        """Count tokens of the serialized context with the model's tokenizer"""
         try:
-            return len(json.dumps(context, default=str))
+            data = orjson.dumps(context, default=str, option=orjson.OPT_NON_STR_KEYS)
         except Exception:
-            return len(str(context))
+            data = str(context).encode()
+        
+        encoder = _get_token_encoder()
+        if encoder is None:
+            return len(data) // 4
+        return len(encoder.encode(data.decode()))
     
     def _calculate_completeness_score(self, context: Dict[str, Any]) -> float:
         """Calculate completeness score based on available data"""
@@ -263,16 +343,32 @@ class ContextFormatter:
             return text
         return text[:max_length-3] + "..."
     
+    def _squeeze_text(self, text: str) -> str:
+        """Drop blank and repeated lines and collapse whitespace (low-information boilerplate)"""
+        if not text:
+            return text
+        seen = set()
+        lines = []
+        for line in text.splitlines():
+            line = " ".join(line.split())
+            if line and line not in seen:
+                seen.add(line)
+                lines.append(line)
+        return "\n".join(lines)
+    
     def _format_timestamp(self, timestamp: Any) -> str:
         """Format timestamp for better readability"""
         if not timestamp:
             return ""
         
         try:
-            if isinstance(timestamp, (int, float)):
+            if isinstance(timestamp, datetime):
+                dt = timestamp
+            elif isinstance(timestamp, (int, float)):
                 dt = datetime.fromtimestamp(timestamp)
             else:
-                dt = datetime.fromisoformat(str(timestamp).replace('Z', '+00:00'))
+                # Python ≥ 3.11: fromisoformat (C) accepte directement le suffixe "Z"
+                dt = datetime.fromisoformat(str(timestamp))
             return dt.strftime("%Y-%m-%d %H:%M:%S UTC")
         except:
             return str(timestamp)
@@ -281,23 +377,19 @@ class ContextFormatter:
         """Extract useful information from tags"""
         summary = {
             "total_tags": len(tags),
-            "service_tags": [tag for tag in tags if tag.startswith("service:")],
-            "env_tags": [tag for tag in tags if tag.startswith("env:")],
-            "k8s_tags": [tag for tag in tags if any(k8s_key in tag for k8s_key in ["pod:", "deployment:", "namespace:"])],
+            "service_tags": [],
+            "env_tags": [],
+            "k8s_tags": [],
             "other_tags": []
         }
         
-        # Collect other relevant tags
+        # Une seule passe: la clé du tag donne directement sa catégorie
         for tag in tags:
-            if not any(tag.startswith(prefix) for prefix in ["service:", "env:", "pod:", "deployment:", "namespace:"]):
-                summary["other_tags"].append(tag)
+            bucket = _TAG_BUCKETS.get(tag.partition(":")[0], "other_tags")
+            summary[bucket].append(tag)
         
         return summary
     
     def _get_pod_status_summary(self, pods: List[Dict[str, Any]]) -> Dict[str, int]:
         """Get summary of pod statuses"""
-        status_counts = {}
-        for pod in pods:
-            status = pod.get("status", "Unknown")
-            status_counts[status] = status_counts.get(status, 0) + 1
-        return status_counts
\ No newline at end of file
+        return dict(Counter(pod.get("status", "Unknown") for pod in pods))
\ No newline at end of file
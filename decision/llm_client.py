@@ -1,13 +1,22 @@
 """
 Client LLM unifié pour K-Fix MVP
-Support OpenAI GPT-4 avec fallback Claude 3.5
+Support OpenAI (routage gpt-4o-mini / gpt-4o)
 """
 
 import os
+import re
+import time
+import sqlite3
+import asyncio
 import logging
+import hashlib
+import threading
+from functools import lru_cache
 from typing import Dict, Any, List
-from dataclasses import dataclass
+from dataclasses import dataclass, replace, asdict
 from enum import Enum
+import orjson
+from cachetools import TTLCache
 
 logger = logging.getLogger(__name__)
 
@@ -25,22 +34,226 @@ class LLMResponse:
     cost_estimate: float
     reasoning_steps: List[str] = None
 
+class PersistentResponseCache:
+    """
+    Cache disque (SQLite) des réponses LLM: survit aux redémarrages de K-Fix
+    Chemin: KFIX_CACHE_DB (défaut ~/.kfix/llm_cache.db), durée: KFIX_CACHE_TTL secondes
+    """
+    DEFAULT_PATH = "~/.kfix/llm_cache.db"
+    DEFAULT_TTL = 7 * 24 * 3600
+    
+    def __init__(self, path: str, ttl: int):
+        self.ttl = ttl
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # Accès depuis les threads de asyncio.to_thread, sérialisé par le verrou
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
+                    response_json TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("DELETE FROM llm_cache WHERE created_at < ?", (time.time() - ttl,))
+    
+    @classmethod
+    def from_env(cls) -> "PersistentResponseCache | None":
+        """Ouvre le cache disque; désactivé si KFIX_CACHE_DB est vide ou le fichier inaccessible"""
+        path = os.getenv("KFIX_CACHE_DB", cls.DEFAULT_PATH)
+        if not path:
+            return None
+        try:
+            cache = cls(os.path.expanduser(path), int(os.getenv("KFIX_CACHE_TTL", cls.DEFAULT_TTL)))
+            logger.info(f"✅ Persistent LLM cache: {path}")
+            return cache
+        except (OSError, sqlite3.Error, ValueError) as e:
+            logger.warning(f"⚠️ Persistent LLM cache disabled: {e}")
+            return None
+    
+    def _get(self, key: str) -> LLMResponse | None:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response_json FROM llm_cache WHERE key = ? AND created_at >= ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+        if row is None:
+            return None
+        data = orjson.loads(row[0])
+        data["provider"] = LLMProvider(data["provider"])
+        return LLMResponse(**data)
+    
+    def _set(self, key: str, response: LLMResponse) -> None:
+        data = asdict(response)
+        data["provider"] = response.provider.value
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response_json, tokens, created_at) VALUES (?, ?, ?, ?)",
+                (key, orjson.dumps(data).decode(), response.tokens_used, time.time())
+            )
+    
+    async def get(self, key: str) -> LLMResponse | None:
+        # I/O disque: hors de la boucle d'événements
+        return await asyncio.to_thread(self._get, key)
+    
+    async def set(self, key: str, response: LLMResponse) -> None:
+        await asyncio.to_thread(self._set, key, response)
+
+class SemanticCache:
+    """
+    Cache sémantique optionnel: réutilise la réponse d'un incident quasi identique
+    (même prompt à un nom de pod / timestamp près). Nécessite faiss-cpu et
+    sentence-transformers; activé seulement si KFIX_SEMCACHE_THRESHOLD est défini
+    """
+    EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+    MAX_ENTRIES = 1024
+    DEFAULT_TTL = 3600  # secondes, comme le cache exact
+    LOOKUP_CANDIDATES = 8  # voisins examinés par recherche
+    
+    # Données volatiles retirées avant embedding: UUIDs, timestamps ISO-8601 / epoch
+    _VOLATILE_PATTERN = re.compile(
+        r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+        r"|\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:?\d{2})?"
+        r"|\b\d{10}(?:\.\d+)?\b",
+        re.IGNORECASE
+    )
+    
+    def __init__(self, threshold: float, faiss_module, model, dimension: int, ttl: float = DEFAULT_TTL):
+        self.threshold = threshold
+        self.ttl = ttl
+        self._faiss = faiss_module
+        self._model = model
+        self._index = faiss_module.IndexFlatIP(dimension)
+        self._entries: List[tuple] = []  # (scope, LLMResponse, stored_at), aligné sur l'index faiss
+    
+    @classmethod
+    def from_env(cls) -> "SemanticCache | None":
+        """Crée le cache si activé et si les dépendances optionnelles sont installées"""
+        threshold = os.getenv("KFIX_SEMCACHE_THRESHOLD")
+        if not threshold:
+            return None
+        try:
+            import faiss
+            from sentence_transformers import SentenceTransformer
+        except ImportError as e:
+            logger.warning(f"⚠️ Semantic cache disabled, missing dependency: {e}")
+            return None
+        
+        ttl = float(os.getenv("KFIX_SEMCACHE_TTL", cls.DEFAULT_TTL))
+        model = SentenceTransformer(cls.EMBEDDING_MODEL)
+        logger.info(f"✅ Semantic LLM cache enabled (threshold {threshold}, TTL {ttl:.0f}s)")
+        return cls(float(threshold), faiss, model, model.get_sentence_embedding_dimension(), ttl)
+    
+    def _embed(self, text: str):
+        """Embedding L2-normalisé (produit scalaire = similarité cosinus)"""
+        normalized = self._VOLATILE_PATTERN.sub("", text)
+        return self._model.encode([normalized], normalize_embeddings=True).astype("float32")
+    
+    async def embed(self, text: str):
+        # Calcul CPU: hors de la boucle d'événements
+        return await asyncio.to_thread(self._embed, text)
+    
+    def lookup(self, vector, scope: str) -> LLMResponse | None:
+        if not self._entries:
+            return None
+        # Plusieurs voisins: une entrée expirée ou d'une autre portée ne masque pas un hit plus loin
+        scores, ids = self._index.search(vector, min(self.LOOKUP_CANDIDATES, len(self._entries)))
+        now = time.monotonic()
+        for score, entry_id in zip(scores[0], ids[0]):
+            if entry_id < 0 or score < self.threshold:
+                break  # Résultats triés par similarité décroissante
+            entry_scope, response, stored_at = self._entries[entry_id]
+            # Entrée expirée: l'état du cluster a pu changer depuis
+            if entry_scope == scope and now - stored_at <= self.ttl:
+                return response
+        return None
+    
+    def add(self, vector, scope: str, response: LLMResponse) -> None:
+        if len(self._entries) >= self.MAX_ENTRIES:
+            # Index plat: on repart de zéro plutôt que de gérer une éviction
+            self._index.reset()
+            self._entries.clear()
+        self._index.add(vector)
+        self._entries.append((scope, response, time.monotonic()))
+
+@lru_cache(maxsize=8)
+def _prompt_cache_key(system_prompt: str) -> str:
+    """Clé de routage OpenAI: même préfixe statique → même machine → cache de prompt chaud"""
+    return "kfix-" + hashlib.blake2b(system_prompt.encode(), digest_size=8).hexdigest()
+
 class LLMClient:
-    OPENAI_MODEL = "gpt-4o-mini"
-    def __init__(self):
+    # 🎚️ Routage: les incidents connus passent d'abord par le modèle économique (escalade si la
+    # réponse est incomplète), les autres directement par le modèle fort
+    CHEAP_MODEL = "gpt-4o-mini"
+    STRONG_MODEL = "gpt-4o"
+    TEMPERATURE = 0.1
+
+    # 💵 Prix OpenAI par 1K tokens (input, output)
+    MODEL_PRICING = {
+        CHEAP_MODEL: (0.00015, 0.0006),
+        STRONG_MODEL: (0.0025, 0.01),
+    }
+
+    KNOWN_INCIDENT_PATTERN = re.compile(
+        r"CrashLoopBackOff|ImagePullBackOff|ErrImagePull|OOMKilled|CreateContainerConfigError|Evicted",
+        re.IGNORECASE
+    )
+    REQUIRED_SECTIONS = ("**ANALYSIS**", "**ROOT CAUSE**", "**SOLUTION**", "**PREVENTION**")
+    MIN_RESPONSE_LENGTH = 400
+    
+    # 💾 Cache exact des réponses: même modèle + mêmes prompts = même réponse
+    RESPONSE_CACHE_SIZE = 1024
+    RESPONSE_CACHE_TTL = 3600  # secondes
+    # Au-delà, les réponses sont trop variables pour être réutilisées
+    MAX_CACHEABLE_TEMPERATURE = 0.2
+    
+    def __init__(self, max_concurrent: int = 4):
         self.primary_provider = LLMProvider.OPENAI
         self._setup_clients()
         
+        # Appels réels au provider simultanés; les hits de cache et les requêtes
+        # fusionnées n'occupent pas de place
+        self._call_semaphore = asyncio.Semaphore(max_concurrent)
+        
         self.total_tokens_used = 0
         self.total_cost = 0.0
+        self.total_prompt_tokens = 0
+        self.total_cached_prompt_tokens = 0
+        
+        self._response_cache = TTLCache(maxsize=self.RESPONSE_CACHE_SIZE, ttl=self.RESPONSE_CACHE_TTL)
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.tokens_saved = 0
+        self._persistent_cache = PersistentResponseCache.from_env()
+        self.persistent_cache_hits = 0
+        self._semantic_cache = SemanticCache.from_env()
+        self.semantic_cache_hits = 0
+        
+        # Appels en cours par clé de cache, partagés entre appelants identiques
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.coalesced_requests = 0
+        
+        self.cheap_model_calls = 0
+        self.escalations = 0
         
     def _setup_clients(self):
         try:
             # OpenAI Client
+            self._http_client = None
             if os.getenv("OPENAI_API_KEY"):
                 import openai
+                import httpx
+                # 🔌 Pool de connexions partagé: keep-alive réutilisé pendant les rafales d'alertes
+                self._http_client = httpx.AsyncClient(
+                    http2=self._http2_available(),
+                    limits=httpx.Limits(max_connections=64, max_keepalive_connections=32),
+                    timeout=httpx.Timeout(30.0, connect=5.0)
+                )
                 self.openai_client = openai.AsyncOpenAI(
-                    api_key=os.getenv("OPENAI_API_KEY")
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    http_client=self._http_client
                 )
                 logger.info("✅ OpenAI client configured")
             else:
@@ -51,71 +264,217 @@ class LLMClient:
             logger.error(f"❌ Missing LLM dependencies: {e}")
             raise
     
+    @staticmethod
+    def _http2_available() -> bool:
+        """HTTP/2 (multiplexage) seulement si le paquet h2 est installé"""
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            return False
+    
+    async def close(self):
+        """Ferme le pool de connexions HTTP"""
+        if self._http_client:
+            await self._http_client.aclose()
+            self._http_client = None
+            logger.info("🔒 LLM HTTP client closed")
+    
     async def generate_solution(
         self, 
         system_prompt: str, 
-        context_prompt: str, 
-        max_tokens: int = 2000
+        context_prompt: str,
+        max_tokens: int = 2000,
+        model: str | None = None
     ) -> LLMResponse:
         """
-        Génère une solution via LLM avec fallback automatique
+        Génère une solution via LLM
+        model: modèle de départ (voir route_model), modèle fort si absent
+        Les réponses identiques récentes sont servies depuis le cache
         """
-    
+        model = model or self.STRONG_MODEL
+        cacheable = self.TEMPERATURE <= self.MAX_CACHEABLE_TEMPERATURE
+        cache_key = self._cache_key(system_prompt, context_prompt, max_tokens, model)
+        if cacheable:
+            cached = self._response_cache.get(cache_key)
+            if cached is not None:
+                self.cache_hits += 1
+                self.tokens_saved += cached.tokens_used
+                logger.info(f"⚡ LLM cache hit ({cached.tokens_used} tokens saved)")
+                return replace(cached, cost_estimate=0.0)
+            self.cache_misses += 1
+        
+        # 🔀 Requête identique déjà en cours (rafale d'alertes): on attend son résultat
+        inflight = self._inflight.get(cache_key)
+        if inflight is not None:
+            self.coalesced_requests += 1
+            response = await asyncio.shield(inflight)
+            logger.info(f"🔀 LLM request coalesced with an identical in-flight call ({response.tokens_used} tokens saved)")
+            self.tokens_saved += response.tokens_used
+            return replace(response, cost_estimate=0.0)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
         try:
-            if self.primary_provider == LLMProvider.OPENAI and self.openai_client:
-                return await self._call_openai(system_prompt, context_prompt, max_tokens)
+            response = await self._generate_uncached(
+                system_prompt, context_prompt, max_tokens, model, cache_key if cacheable else None
+            )
+            future.set_result(response)
+            return response
         except Exception as e:
-            logger.warning(f"⚠️ Primary provider failed: {e}")
-            
-        raise Exception("❌ All LLM providers failed")
-    
-    async def _call_openai(self, system_prompt: str, context_prompt: str, max_tokens: int) -> LLMResponse:
-        """Call OpenAI GPT-4"""
-        response = await self.openai_client.chat.completions.create(
-            model=self.OPENAI_MODEL,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": context_prompt}
-            ],
-            max_tokens=max_tokens,
-            temperature=0.1 
-        )
+            future.set_exception(e)
+            future.exception()  # Marquée comme lue: pas d'avertissement asyncio sans autre appelant
+            raise
+        finally:
+            del self._inflight[cache_key]
+            if not future.done():
+                # Appelant annulé: les requêtes en attente sont annulées aussi
+                future.cancel()
+    
+    async def _generate_uncached(
+        self,
+        system_prompt: str,
+        context_prompt: str,
+        max_tokens: int,
+        model: str,
+        cache_key: str | None
+    ) -> LLMResponse:
+        """Caches disque et sémantique puis appel au provider; cache_key=None désactive la mise en cache"""
+        if cache_key and self._persistent_cache:
+            try:
+                stored = await self._persistent_cache.get(cache_key)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ Persistent LLM cache read failed: {e}")
+                stored = None
+            if stored is not None:
+                self.persistent_cache_hits += 1
+                self.tokens_saved += stored.tokens_used
+                self._response_cache[cache_key] = stored
+                logger.info(f"⚡ LLM persistent cache hit ({stored.tokens_used} tokens saved)")
+                return replace(stored, cost_estimate=0.0)
         
-        tokens_used = response.usage.total_tokens
-        cost = self._calculate_openai_cost(tokens_used)
+        if cache_key and self._semantic_cache:
+            # Portée = prompt système + modèle de départ (route_model): un incident connu, démarré sur le
+            # modèle économique, ne réutilise pas une réponse du modèle fort (et inversement)
+            scope = self._cache_key(system_prompt, "", max_tokens, model)
+            vector = await self._semantic_cache.embed(context_prompt)
+            similar = self._semantic_cache.lookup(vector, scope)
+            if similar is not None:
+                self.semantic_cache_hits += 1
+                self.tokens_saved += similar.tokens_used
+                logger.info(f"⚡ LLM semantic cache hit ({similar.tokens_used} tokens saved)")
+                return replace(similar, cost_estimate=0.0)
+    
+        if not self.openai_client:
+            raise Exception("❌ OpenAI client not configured (OPENAI_API_KEY missing)")
         
-        self._update_usage_stats(tokens_used, cost)
+        # Les erreurs OpenAI remontent telles quelles à l'appelant
+        response = await self._call_routed(system_prompt, context_prompt, max_tokens, model)
+        if cache_key:
+            self._response_cache[cache_key] = response
+            if self._semantic_cache:
+                self._semantic_cache.add(vector, scope, response)
+            if self._persistent_cache:
+                try:
+                    await self._persistent_cache.set(cache_key, response)
+                except sqlite3.Error as e:
+                    logger.warning(f"⚠️ Persistent LLM cache write failed: {e}")
+        return response
+    
+    def _cache_key(self, system_prompt: str, context_prompt: str, max_tokens: int, model: str) -> str:
+        """Clé de cache: hash du modèle, des paramètres et des prompts"""
+        raw = f"{model}|{self.TEMPERATURE}|{max_tokens}|{system_prompt}|{context_prompt}"
+        return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+    
+    def route_model(self, incident_text: str) -> str:
+        """
+        Modèle de départ d'après le texte brut de l'incident (titre, message, raisons d'événements K8s)
+        Modèle économique pour les incidents connus, modèle fort sinon
+        """
+        if self.KNOWN_INCIDENT_PATTERN.search(incident_text):
+            return self.CHEAP_MODEL
+        return self.STRONG_MODEL
+
+    async def _call_routed(self, system_prompt: str, context_prompt: str, max_tokens: int, model: str) -> LLMResponse:
+        """Appel au modèle choisi, escalade vers le modèle fort si la réponse est incomplète"""
+        if model == self.STRONG_MODEL:
+            return await self._call_openai(system_prompt, context_prompt, max_tokens, model)
+        
+        self.cheap_model_calls += 1
+        response = await self._call_openai(system_prompt, context_prompt, max_tokens, model)
+        if self._is_complete(response.content):
+            return response
+        
+        self.escalations += 1
+        logger.info(f"⬆️ Incomplete {model} response, escalating to {self.STRONG_MODEL}")
+        return await self._call_openai(system_prompt, context_prompt, max_tokens, self.STRONG_MODEL)
+    
+    def _is_complete(self, content: str | None) -> bool:
+        """La réponse contient toutes les sections attendues et assez de détail"""
+        if not content or len(content) < self.MIN_RESPONSE_LENGTH:
+            return False
+        upper = content.upper()
+        return all(section in upper for section in self.REQUIRED_SECTIONS)
+    
+    async def _call_openai(self, system_prompt: str, context_prompt: str, max_tokens: int, model: str) -> LLMResponse:
+        """Call OpenAI chat completion (bounded by the concurrency semaphore)"""
+        async with self._call_semaphore:
+            response = await self.openai_client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": context_prompt}
+                ],
+                max_tokens=max_tokens,
+                temperature=self.TEMPERATURE,
+                prompt_cache_key=_prompt_cache_key(system_prompt)
+            )
+        
+        usage = response.usage
+        tokens_used = usage.total_tokens
+        cost = self._calculate_openai_cost(model, usage.prompt_tokens, usage.completion_tokens)
+        
+        # Tokens du préfixe statique servis par le cache de prompt OpenAI
+        details = getattr(usage, "prompt_tokens_details", None)
+        cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+        
+        self._update_usage_stats(tokens_used, cost, usage.prompt_tokens, cached_tokens)
         
         return LLMResponse(
             content=response.choices[0].message.content,
             provider=LLMProvider.OPENAI,
-            model=self.OPENAI_MODEL,
+            model=model,
             tokens_used=tokens_used,
             cost_estimate=cost
         )
     
-    def _calculate_openai_cost(self, total_tokens: int) -> float:
-        """Calcul coût OpenAI GPT-4 Turbo (approximatif)"""
-        # Prix approximatif: $0.01/1K input + $0.03/1K output
-        # Estimation: 70% input, 30% output
-        input_tokens = int(total_tokens * 0.7)
-        output_tokens = int(total_tokens * 0.3)
-        
-        cost = (input_tokens / 1000 * 0.01) + (output_tokens / 1000 * 0.03)
-        return round(cost, 4)
+    def _calculate_openai_cost(self, model: str, prompt_tokens: int, completion_tokens: int) -> float:
+        """Calcul coût OpenAI au prix du modèle appelé (usage réel renvoyé par l'API)"""
+        input_price, output_price = self.MODEL_PRICING.get(model, self.MODEL_PRICING[self.STRONG_MODEL])
+        cost = (prompt_tokens / 1000 * input_price) + (completion_tokens / 1000 * output_price)
+        return round(cost, 6)
     
-    def _update_usage_stats(self, tokens: int, cost: float):
+    def _update_usage_stats(self, tokens: int, cost: float, prompt_tokens: int = 0, cached_tokens: int = 0):
         """Mise à jour des statistiques d'usage"""
         self.total_tokens_used += tokens
         self.total_cost += cost
+        self.total_prompt_tokens += prompt_tokens
+        self.total_cached_prompt_tokens += cached_tokens
         
-        logger.info(f"💰 LLM Call: {tokens} tokens, ${cost:.4f} | Total: {self.total_tokens_used} tokens, ${self.total_cost:.4f}")
+        logger.info(f"💰 LLM Call: {tokens} tokens ({cached_tokens}/{prompt_tokens} prompt tokens cached), ${cost:.4f} | Total: {self.total_tokens_used} tokens, ${self.total_cost:.4f}")
     
     def get_usage_stats(self) -> Dict[str, Any]:
         """Statistiques d'usage pour monitoring"""
         return {
             "total_tokens_used": self.total_tokens_used,
             "total_cost": self.total_cost,
-            "primary_provider": self.primary_provider.value,
-            "fallback_provider": self.fallback_provider.value
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "persistent_cache_hits": self.persistent_cache_hits,
+            "semantic_cache_hits": self.semantic_cache_hits,
+            "coalesced_requests": self.coalesced_requests,
+            "escalation_rate": round(self.escalations / self.cheap_model_calls, 3) if self.cheap_model_calls else 0.0,
+            "prompt_cache_hit_rate": round(self.total_cached_prompt_tokens / self.total_prompt_tokens, 3) if self.total_prompt_tokens else 0.0,
+            "tokens_saved": self.tokens_saved,
+            "primary_provider": self.primary_provider.value
         }
\ No newline at end of file
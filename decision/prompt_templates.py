@@ -5,13 +5,78 @@ Optimized prompts for Kubernetes incident resolution
 
 from typing import Dict, Any
 
-class PromptTemplates:
-    """Structured prompt templates for K-Fix"""
-    
-    @staticmethod
-    def get_system_prompt() -> str:
-        """System prompt defining K-Fix role and capabilities"""
-        return """You are K-Fix, a DevOps/SRE expert specialized in Kubernetes incident resolution.
+# Modèle utilisé pour choisir l'encodage tiktoken (cf. LLMClient.CHEAP_MODEL)
+TOKENIZER_MODEL = "gpt-4o-mini"
+
+# 📚 Référence statique placée juste après le system prompt. Avec lui elle forme un
+# préfixe identique d'un appel à l'autre et > 1024 tokens: OpenAI le met en cache
+# côté serveur (tokens d'entrée facturés moitié prix). Ne rien y interpoler.
+INCIDENT_TAXONOMY_REFERENCE = """KUBERNETES FAILURE TAXONOMY (reference):
+
+POD LIFECYCLE FAILURES:
+- CrashLoopBackOff: the container starts then exits repeatedly. Check the exit code and the logs of the previous run. Common causes: application error at startup, missing configuration or secret, failing dependency, wrong command/args, liveness probe killing a slow starter.
+- OOMKilled (exit code 137): the container exceeded its memory limit. Compare usage with limits, look for leaks or unbounded caches, raise the limit or tune the runtime heap (JVM -Xmx, Node --max-old-space-size).
+- Error (exit code 1 or other non-zero): application failure. Read the logs of the previous container instance.
+- Exit code 143: SIGTERM, usually a normal shutdown during rollout or eviction; check terminationGracePeriodSeconds if shutdowns are cut short.
+- ImagePullBackOff / ErrImagePull: wrong image name or tag, private registry without imagePullSecrets, registry rate limiting or unreachable.
+- CreateContainerConfigError: referenced ConfigMap or Secret (or one of its keys) does not exist.
+- RunContainerError / ContainerCannotRun: invalid entrypoint, missing binary, bad volume mount or security context.
+- Pending (unschedulable): insufficient CPU/memory on nodes, unsatisfiable nodeSelector/affinity, taints without tolerations, unbound PersistentVolumeClaim, ResourceQuota exhausted.
+- Evicted: node pressure (memory, disk, PIDs). Pods without requests are evicted first (BestEffort QoS).
+- Terminating (stuck): finalizers not removed, unreachable node, volume detach blocked.
+
+PROBE FAILURES:
+- Liveness probe failed: the kubelet restarts the container. Too aggressive thresholds on slow starters cause restart loops; prefer a startupProbe.
+- Readiness probe failed: the pod is removed from Service endpoints but not restarted. Leads to 503s or reduced capacity, not restarts.
+- Startup probe failed: the container never became ready within failureThreshold * periodSeconds.
+
+DEPLOYMENT AND ROLLOUT FAILURES:
+- ProgressDeadlineExceeded: new ReplicaSet pods never became ready; the rollout is stalled.
+- ReplicaFailure: pods could not be created (quota, admission webhook, invalid spec).
+- Ready replicas lower than desired replicas: some pods are crashing, pending or failing readiness.
+- Bad rollout: a regression in the new image; compare revisions and roll back with kubectl rollout undo.
+
+RESOURCE AND CAPACITY ISSUES:
+- CPU throttling: usage at the CPU limit causes latency, probe timeouts and cascading restarts without any OOM.
+- Memory pressure on the node: evictions and OOM kills of other workloads.
+- Disk pressure: full node filesystem or ephemeral-storage limit exceeded (logs, emptyDir).
+- HPA at maxReplicas: demand exceeds the configured autoscaling ceiling.
+
+NETWORKING AND DEPENDENCIES:
+- Service without endpoints: selector does not match pod labels, or no pod is ready.
+- DNS resolution failures: CoreDNS overloaded or misconfigured, ndots search path latency.
+- NetworkPolicy blocking traffic between namespaces or to external dependencies.
+- Upstream dependency down (database, cache, external API): the pod is healthy but the application fails.
+
+CONFIGURATION ISSUES:
+- Missing or wrong environment variables, ConfigMap or Secret changes without a pod restart.
+- Expired certificates or rotated credentials.
+- Resource requests/limits inconsistent with real usage.
+
+KUBECTL DIAGNOSTIC CHEAT-SHEET:
+- kubectl describe pod <pod> -n <namespace>            (events, probes, last state, exit code)
+- kubectl logs <pod> -n <namespace> --previous          (logs of the crashed instance)
+- kubectl logs <pod> -n <namespace> -c <container>      (multi-container pods)
+- kubectl get events -n <namespace> --sort-by=.lastTimestamp
+- kubectl top pod <pod> -n <namespace> --containers     (current CPU/memory usage)
+- kubectl get pod <pod> -n <namespace> -o yaml          (full spec and status)
+- kubectl rollout status deployment/<deployment> -n <namespace>
+- kubectl rollout history deployment/<deployment> -n <namespace>
+- kubectl rollout undo deployment/<deployment> -n <namespace>
+- kubectl rollout restart deployment/<deployment> -n <namespace>
+- kubectl scale deployment/<deployment> -n <namespace> --replicas=<n>
+- kubectl set resources deployment/<deployment> -n <namespace> --limits=memory=<size>
+- kubectl describe node <node>                          (conditions, allocatable, pressure)
+- kubectl get endpoints <service> -n <namespace>
+
+SAFE REMEDIATION PRINCIPLES:
+- Prefer reversible actions: rollback, restart, scale, resource adjustment.
+- Always give the verification command that confirms the fix worked.
+- Never delete PersistentVolumeClaims, namespaces or data without explicit confirmation.
+- Persist the fix in the manifests / GitOps repository, not only with kubectl."""
+
+# Construit une seule fois à l'import (préfixe identique à chaque appel)
+_SYSTEM_PROMPT = """You are K-Fix, a DevOps/SRE expert specialized in Kubernetes incident resolution.
 
 MISSION:
 - Analyze Kubernetes incidents with precision
@@ -33,7 +98,25 @@ RESPONSE FORMAT:
 1. **ANALYSIS**: Incident diagnosis
 2. **ROOT CAUSE**: Main problem identification
 3. **SOLUTION**: Concrete actions to perform
-4. **PREVENTION**: Measures to avoid recurrence"""
+4. **PREVENTION**: Measures to avoid recurrence
+
+""" + INCIDENT_TAXONOMY_REFERENCE
+
+# Parties fixes du prompt de contexte, construites une fois: seul le contenu de l'incident varie
+_CONTEXT_PROMPT_HEADER = "INCIDENT TO ANALYZE:\n\n=== EVENT DETAILS ==="
+_CONTEXT_PROMPT_INSTRUCTIONS = (
+    "\nINSTRUCTIONS:\n"
+    "Analyze this incident and propose a structured solution according to the requested format.\n"
+    "Focus on concrete and automatable actions."
+)
+
+class PromptTemplates:
+    """Structured prompt templates for K-Fix"""
+    
+    @staticmethod
+    def get_system_prompt() -> str:
+        """System prompt defining K-Fix role and capabilities"""
+        return _SYSTEM_PROMPT
 
     @staticmethod
     def get_context_prompt(enriched_data: Dict[str, Any]) -> str:
@@ -45,85 +128,88 @@ RESPONSE FORMAT:
         processing_time = enriched_data.get("processing_time")
         enrichment_status = enriched_data.get("enrichment_status", "unknown")
         
-        prompt = f"""INCIDENT TO ANALYZE:
-
-=== EVENT DETAILS ===
-Event ID: {event_details.get('event_id', 'N/A')}
-Title: {event_details.get('title', 'N/A')}
-Message: {event_details.get('message', 'N/A')}
-Timestamp: {event_details.get('timestamp', 'N/A')}
-Tags: {', '.join(event_details.get('tags', []))}
-
-=== KUBERNETES CONTEXT ==="""
+        # Lignes accumulées puis jointes une seule fois (pas de += en boucle)
+        parts = [
+            _CONTEXT_PROMPT_HEADER,
+            f"Event ID: {event_details.get('event_id', 'N/A')}",
+            f"Title: {event_details.get('title', 'N/A')}",
+            f"Message: {event_details.get('message', 'N/A')}",
+            f"Timestamp: {event_details.get('timestamp', 'N/A')}",
+            f"Tags: {', '.join(event_details.get('tags', []))}",
+            "",
+            "=== KUBERNETES CONTEXT ==="
+        ]
         
         # Pod context
         pod_info = k8s_context.get("pod", {})
         if pod_info and "error" not in pod_info:
-            prompt += f"""
-Pod:
-- Name: {pod_info.get('name', 'N/A')}
-- Namespace: {pod_info.get('namespace', 'N/A')}
-- Status: {pod_info.get('status', 'N/A')}
-- Restarts: {pod_info.get('restarts', 0)}
-- Containers: {len(pod_info.get('container_statuses', []))}"""
+            container_statuses = pod_info.get('container_statuses', [])
+            parts.extend([
+                "Pod:",
+                f"- Name: {pod_info.get('name', 'N/A')}",
+                f"- Namespace: {pod_info.get('namespace', 'N/A')}",
+                f"- Status: {pod_info.get('status', 'N/A')}",
+                f"- Restarts: {pod_info.get('restarts', 0)}",
+                f"- Containers: {len(container_statuses)}"
+            ])
             
             # Container details
-            for container in pod_info.get('container_statuses', []):
-                prompt += f"""
-  - {container.get('name')}: Ready={container.get('ready')}, Restarts={container.get('restart_count')}, LastState={container.get('last_state')}"""
+            parts.extend(
+                f"  - {container.get('name')}: Ready={container.get('ready')}, Restarts={container.get('restart_count')}, LastState={container.get('last_state')}"
+                for container in container_statuses
+            )
         else:
-            prompt += f"\nPod: {pod_info.get('error', 'Information not available')}"
+            parts.append(f"Pod: {pod_info.get('error', 'Information not available')}")
         
         # Deployment context
         deployment_info = k8s_context.get("deployment", {})
         if deployment_info and "error" not in deployment_info:
-            prompt += f"""
-
-Deployment:
-- Name: {deployment_info.get('name', 'N/A')}
-- Desired replicas: {deployment_info.get('replicas', 'N/A')}
-- Ready replicas: {deployment_info.get('ready_replicas', 'N/A')}"""
+            parts.extend([
+                "",
+                "Deployment:",
+                f"- Name: {deployment_info.get('name', 'N/A')}",
+                f"- Desired replicas: {deployment_info.get('replicas', 'N/A')}",
+                f"- Ready replicas: {deployment_info.get('ready_replicas', 'N/A')}"
+            ])
             
             resources = deployment_info.get('resources', {})
             if resources:
-                prompt += f"""
-- Resources: {resources}"""
+                parts.append(f"- Resources: {resources}")
         else:
-            prompt += f"\nDeployment: {deployment_info.get('error', 'Information not available')}"
+            parts.append(f"Deployment: {deployment_info.get('error', 'Information not available')}")
         
         # Kubernetes Events
         events = k8s_context.get("events", [])
         if events:
-            prompt += f"\n\nRecent events:"
-            for event in events[:5]:  # Limit to 5 events
-                prompt += f"""
-- {event.get('type', 'N/A')}: {event.get('reason', 'N/A')} - {event.get('message', 'N/A')}"""
+            parts.extend(["", "Recent events:"])
+            parts.extend(
+                f"- {event.get('type', 'N/A')}: {event.get('reason', 'N/A')} - {event.get('message', 'N/A')}"
+                for event in events[:5]  # Limit to 5 events
+            )
         
         # Automatic discovery information
         discovery_info = k8s_context.get("discovery_info", {})
         if discovery_info:
-            prompt += f"""
-
-=== AUTOMATIC DISCOVERY ===
-Strategy: {discovery_info.get('search_strategy', 'N/A')}
-Found namespace: {discovery_info.get('found_namespace', 'N/A')}
-Discovered deployment: {discovery_info.get('found_deployment', 'N/A')}"""
+            parts.extend([
+                "",
+                "=== AUTOMATIC DISCOVERY ===",
+                f"Strategy: {discovery_info.get('search_strategy', 'N/A')}",
+                f"Found namespace: {discovery_info.get('found_namespace', 'N/A')}",
+                f"Discovered deployment: {discovery_info.get('found_deployment', 'N/A')}"
+            ])
         
         # Processing metadata
         if processing_time:
-            prompt += f"""
-
-=== PROCESSING METADATA ===
-Processing time: {processing_time:.2f}s
-Enrichment status: {enrichment_status}"""
+            parts.extend([
+                "",
+                "=== PROCESSING METADATA ===",
+                f"Processing time: {processing_time:.2f}s",
+                f"Enrichment status: {enrichment_status}"
+            ])
         
-        prompt += """
-
-INSTRUCTIONS:
-Analyze this incident and propose a structured solution according to the requested format.
-Focus on concrete and automatable actions."""
+        parts.append(_CONTEXT_PROMPT_INSTRUCTIONS)
         
-        return prompt
+        return "\n".join(parts)
 
     @staticmethod
     def get_validation_prompt(solution: str) -> str:
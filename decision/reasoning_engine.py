@@ -3,25 +3,35 @@ Reasoning Engine for K-Fix MVP
 Core orchestration component for incident resolution workflow
 """
 
+import re
+import time
+import asyncio
 import logging
 from typing import Dict, Any, Optional, List
 from dataclasses import dataclass
-from datetime import datetime
+from enum import Enum
 
-from .llm_client import LLMClient, LLMResponse
+from .llm_client import LLMClient, LLMResponse, LLMProvider
 from .prompt_templates import PromptTemplates
 from .context_formatter import ContextFormatter
 from .solution_generator import SolutionGenerator
 
 logger = logging.getLogger(__name__)
 
+# Indicateurs de risque, un seul passage regex par texte. Début de mot pour la solution
+# ("deleted", "removing" comptent), mot entier pour les commandes ("rm" ≠ "--format")
+_HIGH_RISK_RE = re.compile(r"\b(?:delete|remove|destroy|drop|terminate)", re.IGNORECASE)
+_MEDIUM_RISK_RE = re.compile(r"\b(?:restart|scale|update|patch|modify)", re.IGNORECASE)
+_HIGH_RISK_CMD_RE = re.compile(r"\b(?:delete|rm|destroy)\b", re.IGNORECASE)
+
 class RiskLevel(Enum):
     """Risk levels for solution safety assessment"""
     LOW = "LOW"
     MEDIUM = "MEDIUM"
     HIGH = "HIGH"
+    UNKNOWN = "UNKNOWN"
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class IncidentAnalysis:
     """Structured incident analysis result"""
     incident_id: str
@@ -34,7 +44,7 @@ class IncidentAnalysis:
     estimated_resolution_time: str
     risk_level: RiskLevel
     
-@dataclass
+@dataclass(slots=True, frozen=True)
 class ReasoningResult:
     """Complete reasoning engine result"""
     incident_analysis: IncidentAnalysis
@@ -50,8 +60,10 @@ class ReasoningEngine:
     Orchestrates: Context → LLM → Solution → Actions
     """
     
-    def __init__(self):
-        self.llm_client = LLMClient()
+    def __init__(self, max_concurrent: int = 4):
+        # max_concurrent borne les appels LLM réels; les doublons en vol et les hits
+        # de cache sont servis sans occuper de place
+        self.llm_client = LLMClient(max_concurrent=max_concurrent)
         self.context_formatter = ContextFormatter()
         self.solution_generator = SolutionGenerator()
         
@@ -72,20 +84,24 @@ class ReasoningEngine:
                 - enrichment_status: Status of the enrichment process
         """
 
-        start_time = datetime.now()
+        start_time = time.perf_counter()
         
         # Extract incident ID from event_details
         event_details = enriched_data.get("event_details", {})
-        incident_id = event_details.get("event_id", f"incident_{int(start_time.timestamp())}")
+        incident_id = event_details.get("event_id", f"incident_{int(time.time())}")
         
         logger.info(f"🔍 Starting incident analysis: {incident_id}")
         
+        # Ne dépend que de enriched_data: calculé une fois pour les deux chemins
+        context_summary = self._create_context_summary(enriched_data)
+        
         try:
-            # Step 1: Format and validate context
+            # Step 1: Format and validate context (hors de la boucle d'événements)
             formatted_context = await self._prepare_context(enriched_data)
             
-            # Step 2: Generate LLM analysis
-            llm_response = await self._generate_llm_analysis(formatted_context)
+            # Step 2: Generate LLM analysis (modèle choisi sur le texte brut de l'alerte)
+            model = self.llm_client.route_model(self._routing_text(enriched_data))
+            llm_response = await self._generate_llm_analysis(formatted_context, model)
             
             # Step 3: Parse and structure solution
             incident_analysis = await self._parse_llm_response(llm_response, incident_id)
@@ -94,12 +110,12 @@ class ReasoningEngine:
             is_safe = await self._validate_solution_safety(incident_analysis)
             
             # Step 5: Calculate confidence and create result
-            processing_time = (datetime.now() - start_time).total_seconds()
+            processing_time = time.perf_counter() - start_time
             
             result = ReasoningResult(
                 incident_analysis=incident_analysis,
                 llm_response=llm_response,
-                context_summary=self._create_context_summary(enriched_data),
+                context_summary=context_summary,
                 processing_time=processing_time,
                 success=True
             )
@@ -113,13 +129,15 @@ class ReasoningEngine:
         except Exception as e:
             logger.error(f"❌ Failed to analyze incident {incident_id}: {e}")
             
-            processing_time = (datetime.now() - start_time).total_seconds()
+            processing_time = time.perf_counter() - start_time
             self._update_statistics(processing_time, False)
             
             return ReasoningResult(
                 incident_analysis=self._create_fallback_analysis(incident_id, str(e)),
-                llm_response=LLMResponse(content="", model="fallback", tokens_used=0, cost=0.0),
-                context_summary=self._create_context_summary(enriched_data),
+                llm_response=LLMResponse(
+                    content="", provider=LLMProvider.OPENAI, model="fallback", tokens_used=0, cost_estimate=0.0
+                ),
+                context_summary=context_summary,
                 processing_time=processing_time,
                 success=False,
                 error_message=str(e)
@@ -129,6 +147,12 @@ class ReasoningEngine:
         """Prepare and validate context for LLM processing"""
         logger.debug("📋 Preparing context for LLM")
         
+        # Formatage + comptage de tokens = CPU pur: exécuté dans un thread pour ne pas
+        # bloquer les autres incidents en attente de leur réponse LLM
+        return await asyncio.to_thread(self._format_and_validate_context, enriched_data)
+    
+    def _format_and_validate_context(self, enriched_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Format the context and log validation issues (synchronous, runs in a worker thread)"""
         # Format context using ContextFormatter
         formatted_context = self.context_formatter.format_context(enriched_data)
         
@@ -140,7 +164,15 @@ class ReasoningEngine:
         
         return formatted_context
     
-    async def _generate_llm_analysis(self, formatted_context: Dict[str, Any]) -> LLMResponse:
+    def _routing_text(self, enriched_data: Dict[str, Any]) -> str:
+        """Raw incident text used for model routing: alert title/message + K8s event reasons"""
+        event_details = enriched_data.get("event_details") or {}
+        k8s_context = enriched_data.get("k8s_context") or {}
+        parts = [str(event_details.get("title") or ""), str(event_details.get("message") or "")]
+        parts.extend(str(event.get("reason") or "") for event in k8s_context.get("events") or [])
+        return " ".join(parts)
+    
+    async def _generate_llm_analysis(self, formatted_context: Dict[str, Any], model: Optional[str] = None) -> LLMResponse:
         """Generate incident analysis using LLM"""
         logger.debug("🤖 Generating LLM analysis")
         
@@ -155,7 +187,8 @@ class ReasoningEngine:
         llm_response = await self.llm_client.generate_solution(
             system_prompt=system_prompt,
             context_prompt=context_prompt,
-            max_tokens=2000
+            max_tokens=2000,
+            model=model
         )
         
         logger.info(f"💰 LLM call completed - Provider: {llm_response.provider.value}, "
@@ -172,7 +205,8 @@ class ReasoningEngine:
         logger.debug("📝 Parsing LLM response")
         
         # Use SolutionGenerator to parse the response
-        parsed_solution = self.solution_generator.parse_llm_response(llm_response.content)
+        # (regex sur jusqu'à ~2000 tokens: dans un thread pour libérer la boucle d'événements)
+        parsed_solution = await asyncio.to_thread(self.solution_generator.parse_llm_response, llm_response.content)
         
         # Calculate confidence score based on response quality
         confidence_score = self._calculate_confidence_score(llm_response, parsed_solution)
@@ -233,26 +267,22 @@ class ReasoningEngine:
         
         return min(score, 1.0)
     
-    def _assess_risk_level(self, parsed_solution: Dict[str, Any]) -> str:
+    def _assess_risk_level(self, parsed_solution: Dict[str, Any]) -> RiskLevel:
         """Assess risk level of the proposed solution"""
         commands = parsed_solution.get("commands", [])
-        solution_text = parsed_solution.get("solution", "").lower()
+        solution_text = parsed_solution.get("solution", "")
         
         # High risk indicators
-        high_risk_keywords = ["delete", "remove", "destroy", "drop", "terminate"]
-        if any(keyword in solution_text for keyword in high_risk_keywords):
+        if _HIGH_RISK_RE.search(solution_text):
             return RiskLevel.HIGH
         
         # Medium risk indicators
-        medium_risk_keywords = ["restart", "scale", "update", "patch", "modify"]
-        if any(keyword in solution_text for keyword in medium_risk_keywords):
+        if _MEDIUM_RISK_RE.search(solution_text):
             return RiskLevel.MEDIUM
         
         # Check commands for risk
-        if commands:
-            for cmd in commands:
-                if any(risk_cmd in cmd.lower() for risk_cmd in ["delete", "rm", "destroy"]):
-                    return RiskLevel.HIGH
+        if any(_HIGH_RISK_CMD_RE.search(cmd) for cmd in commands):
+            return RiskLevel.HIGH
         
         return RiskLevel.LOW
     
@@ -282,7 +312,7 @@ class ReasoningEngine:
             commands=[],
             confidence_score=0.0,
             estimated_resolution_time="Manual",
-            risk_level="UNKNOWN"
+            risk_level=RiskLevel.UNKNOWN
         )
     
     def _update_statistics(self, processing_time: float, success: bool):
@@ -292,14 +322,10 @@ class ReasoningEngine:
         if success:
             self.successful_resolutions += 1
         
-        # Update average processing time
-        if self.total_incidents_processed == 1:
-            self.average_processing_time = processing_time
-        else:
-            self.average_processing_time = (
-                (self.average_processing_time * (self.total_incidents_processed - 1) + processing_time) 
-                / self.total_incidents_processed
-            )
+        # Moyenne incrémentale: pas de re-multiplication par N (stable sur de longues durées)
+        self.average_processing_time += (
+            (processing_time - self.average_processing_time) / self.total_incidents_processed
+        )
     
     def get_performance_stats(self) -> Dict[str, Any]:
         """Get performance statistics"""
@@ -3,14 +3,57 @@ Solution Generator for K-Fix MVP
 Parses LLM responses and generates actionable solutions
 """
 
+import time
 import logging
 import re
 from typing import Dict, Any, List
 from enum import Enum
-import json
+import orjson
 
 logger = logging.getLogger(__name__)
 
+# En-têtes de section acceptés dans la réponse LLM, avec leurs formats (gras, simple,
+# liste numérotée) compilés une fois au chargement du module
+_SECTION_RES = {
+    header: (
+        re.compile(rf"\*\*{header}\*\*[:\s]*(.+?)(?=\*\*|\n\n|$)", re.IGNORECASE | re.DOTALL),
+        re.compile(rf"{header}[:\s]*(.+?)(?=\n\n|$)", re.IGNORECASE | re.DOTALL),
+        re.compile(rf"\d+\.\s*\*\*{header}\*\*[:\s]*(.+?)(?=\d+\.|$)", re.IGNORECASE | re.DOTALL),
+    )
+    for header in ("ANALYSIS", "ANALYSE", "ROOT CAUSE", "CAUSE RACINE", "SOLUTION", "PREVENTION", "PRÉVENTION")
+}
+
+_CODE_BLOCK_RE = re.compile(r'```(?:bash|shell|sh)?\n(.*?)\n```', re.DOTALL)
+_COMMAND_RES = [
+    re.compile(r'kubectl\s+[^\n]+'),
+    re.compile(r'helm\s+[^\n]+'),
+    re.compile(r'docker\s+[^\n]+'),
+    re.compile(r'systemctl\s+[^\n]+'),
+]
+_TIME_RES = [
+    re.compile(r'estimated?\s+time[:\s]*([^\n]+)', re.IGNORECASE),
+    re.compile(r'resolution\s+time[:\s]*([^\n]+)', re.IGNORECASE),
+    re.compile(r'should\s+take[:\s]*([^\n]+)', re.IGNORECASE),
+    re.compile(r'(\d+\s*(?:minutes?|hours?|mins?))', re.IGNORECASE),
+]
+
+# Indicateurs de priorité (recherche de sous-chaîne sur le texte en minuscules)
+_HIGH_PRIORITY_KEYWORDS = (
+    "critical", "urgent", "down", "outage", "failure",
+    "crash", "emergency", "severe", "production"
+)
+_LOW_PRIORITY_KEYWORDS = (
+    "minor", "cosmetic", "enhancement", "optimization",
+    "cleanup", "documentation", "low impact"
+)
+
+# Couleur des notifications Slack selon la priorité
+_SLACK_PRIORITY_COLORS = {
+    "High": "#ff0000",    # Red
+    "Medium": "#ffaa00",  # Orange
+    "Low": "#00aa00"      # Green
+}
+
 class RiskLevel(Enum):
     """Risk levels for solution safety assessment"""
     LOW = "LOW"
@@ -105,25 +148,24 @@ class SolutionGenerator:
                 safety_issues.append(f"Dangerous command detected: {dangerous_cmd}")
                 risk_level = RiskLevel.HIGH
         
-        # Check individual commands
+        # Check individual commands (une alerte par catégorie et par commande)
         for cmd in commands:
             cmd_lower = cmd.lower().strip()
             
             # Check for destructive kubectl commands
-            if cmd_lower.startswith("kubectl"):
-                for destructive in self.kubectl_destructive:
-                    if destructive in cmd_lower:
-                        safety_issues.append(f"Destructive kubectl command: {cmd}")
-                        risk_level = "HIGH"
+            if cmd_lower.startswith("kubectl") and any(
+                destructive in cmd_lower for destructive in self.kubectl_destructive
+            ):
+                safety_issues.append(f"Destructive kubectl command: {cmd}")
+                risk_level = RiskLevel.HIGH
             
             # Check for system-level dangerous commands
-            for dangerous_cmd in self.dangerous_commands:
-                if dangerous_cmd in cmd_lower:
-                    safety_issues.append(f"Dangerous system command: {cmd}")
-                    risk_level = "HIGH"
+            if any(dangerous_cmd in cmd_lower for dangerous_cmd in self.dangerous_commands):
+                safety_issues.append(f"Dangerous system command: {cmd}")
+                risk_level = RiskLevel.HIGH
         
         # Determine if solution is safe
-        is_safe = risk_level != RiskLevel.HIGH
+        is_safe = risk_level is not RiskLevel.HIGH
         
         return {
             "is_safe": is_safe,
@@ -177,14 +219,8 @@ class SolutionGenerator:
         logger.debug("💬 Generating Slack notification")
         
         # Determine message color based on priority
-        color_map = {
-            "High": "#ff0000",    # Red
-            "Medium": "#ffaa00",  # Orange
-            "Low": "#00aa00"      # Green
-        }
-        
         priority = solution.get("priority", "Medium")
-        color = color_map.get(priority, "#ffaa00")
+        color = _SLACK_PRIORITY_COLORS.get(priority, "#ffaa00")
         
         # Create message blocks
         blocks = [
@@ -253,14 +289,8 @@ class SolutionGenerator:
         """Extract content from a specific section"""
         for section_name in section_names:
             # Try different patterns
-            patterns = [
-                rf"\*\*{section_name}\*\*[:\s]*(.+?)(?=\*\*|\n\n|$)",
-                rf"{section_name}[:\s]*(.+?)(?=\n\n|$)",
-                rf"\d+\.\s*\*\*{section_name}\*\*[:\s]*(.+?)(?=\d+\.|$)"
-            ]
-            
-            for pattern in patterns:
-                match = re.search(pattern, content, re.IGNORECASE | re.DOTALL)
+            for pattern in _SECTION_RES[section_name]:
+                match = pattern.search(content)
                 if match:
                     return match.group(1).strip()
         
@@ -271,7 +301,7 @@ class SolutionGenerator:
         commands = []
         
         # Look for code blocks
-        code_blocks = re.findall(r'```(?:bash|shell|sh)?\n(.*?)\n```', content, re.DOTALL)
+        code_blocks = _CODE_BLOCK_RE.findall(content)
         for block in code_blocks:
             lines = block.strip().split('\n')
             for line in lines:
@@ -279,42 +309,17 @@ class SolutionGenerator:
                 if line and not line.startswith('#'):
                     commands.append(line)
         
-        # Look for kubectl commands specifically
-        kubectl_commands = re.findall(r'kubectl\s+[^\n]+', content)
-        commands.extend(kubectl_commands)
-        
-        # Look for other common commands
-        command_patterns = [
-            r'helm\s+[^\n]+',
-            r'docker\s+[^\n]+',
-            r'systemctl\s+[^\n]+'
-        ]
-        
-        for pattern in command_patterns:
-            found_commands = re.findall(pattern, content)
-            commands.extend(found_commands)
+        # Look for kubectl commands, then other common commands
+        for pattern in _COMMAND_RES:
+            commands.extend(pattern.findall(content))
         
         # Remove duplicates while preserving order
-        seen = set()
-        unique_commands = []
-        for cmd in commands:
-            if cmd not in seen:
-                seen.add(cmd)
-                unique_commands.append(cmd)
-        
-        return unique_commands[:10]  # Limit to 10 commands
+        return list(dict.fromkeys(commands))[:10]  # Limit to 10 commands
     
     def _extract_estimated_time(self, content: str) -> str:
         """Extract estimated resolution time"""
-        time_patterns = [
-            r'estimated?\s+time[:\s]*([^\n]+)',
-            r'resolution\s+time[:\s]*([^\n]+)',
-            r'should\s+take[:\s]*([^\n]+)',
-            r'(\d+\s*(?:minutes?|hours?|mins?))'
-        ]
-        
-        for pattern in time_patterns:
-            match = re.search(pattern, content, re.IGNORECASE)
+        for pattern in _TIME_RES:
+            match = pattern.search(content)
             if match:
                 return match.group(1).strip()
         
@@ -324,20 +329,8 @@ class SolutionGenerator:
         """Determine priority based on content analysis"""
         content_lower = content.lower()
         
-        # High priority indicators
-        high_priority_keywords = [
-            "critical", "urgent", "down", "outage", "failure", 
-            "crash", "emergency", "severe", "production"
-        ]
-        
-        # Low priority indicators
-        low_priority_keywords = [
-            "minor", "cosmetic", "enhancement", "optimization",
-            "cleanup", "documentation", "low impact"
-        ]
-        
-        high_count = sum(1 for keyword in high_priority_keywords if keyword in content_lower)
-        low_count = sum(1 for keyword in low_priority_keywords if keyword in content_lower)
+        high_count = sum(1 for keyword in _HIGH_PRIORITY_KEYWORDS if keyword in content_lower)
+        low_count = sum(1 for keyword in _LOW_PRIORITY_KEYWORDS if keyword in content_lower)
         
         if high_count > low_count and high_count > 0:
             return Priority.HIGH.value
@@ -380,8 +373,8 @@ class SolutionGenerator:
         
         return [
             {
-                "file_path": f"incidents/incident_{int(datetime.now().timestamp())}.json",
-                "content": json.dumps(incident_report, indent=2),
+                "file_path": f"incidents/incident_{int(time.time())}.json",
+                "content": orjson.dumps(incident_report, option=orjson.OPT_INDENT_2).decode(),
                 "action": "create"
             }
         ]
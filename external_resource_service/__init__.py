@@ -1,11 +1,14 @@
 from .database import AlertDatabase, AlertStatus
 from .datadog_client import DatadogClientManager, datadog_manager
-from .k8s_context import get_k8s_context
+from .k8s_client_manager import K8sClientManager
+from .k8s_context import get_k8s_context, k8s_manager
 
 __all__ = [
     "AlertDatabase",
     "AlertStatus", 
     "DatadogClientManager",
     "datadog_manager",
+    "K8sClientManager",
+    "k8s_manager",
     "get_k8s_context"
 ]
\ No newline at end of file
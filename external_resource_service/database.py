@@ -1,7 +1,7 @@
 import os
 import logging
-import json
-from typing import Dict, Any, List
+import orjson
+from typing import Dict, Any, List, Tuple
 from enum import Enum
 import asyncpg
 from datetime import datetime
@@ -9,6 +9,143 @@ import asyncio
 
 logger = logging.getLogger(__name__)
 
+# Hot-path statements: kept as constants so every call sends byte-identical SQL
+# and hits asyncpg's per-connection prepared statement cache
+_SQL_INSERT_ALERT = """
+    INSERT INTO alerts (alert_hash, payload) 
+    VALUES ($1, $2)
+    ON CONFLICT (alert_hash) DO NOTHING
+    RETURNING alert_hash
+"""
+
+# Status writes are queued and flushed by a single writer task: at most
+# STATUS_BATCH_SIZE updates, or whatever arrived within STATUS_FLUSH_INTERVAL seconds
+STATUS_BATCH_SIZE = 100
+STATUS_FLUSH_INTERVAL = 0.05
+
+# One statement per flush: one unnest row per alert (updates to the same alert are
+# coalesced first). resolved stamps processed_at, retries counts the non-RESOLVED
+# transitions; NULL data/error keep the previous values
+_SQL_UPDATE_ALERT_STATUS_BATCH = """
+    UPDATE alerts AS a
+    SET status = u.status,
+        updated_at = NOW(),
+        processed_at = CASE WHEN u.resolved THEN NOW() ELSE a.processed_at END,
+        enriched_data = COALESCE(u.enriched_data, a.enriched_data),
+        error_message = COALESCE(u.error_message, a.error_message),
+        retry_count = a.retry_count + u.retries
+    FROM unnest($1::varchar[], $2::text[], $3::jsonb[], $4::text[], $5::bool[], $6::int[])
+        AS u(alert_hash, status, enriched_data, error_message, resolved, retries)
+    WHERE a.alert_hash = u.alert_hash
+"""
+
+# Deletes at most $3 rows per statement so cleanup never holds long locks
+_SQL_DELETE_OLD_ALERTS_BATCH = """
+    DELETE FROM alerts
+    WHERE ctid IN (
+        SELECT ctid FROM alerts
+        WHERE status = ANY($1::text[])
+        AND updated_at < NOW() - make_interval(days => $2)
+        LIMIT $3
+    )
+"""
+
+CLEANUP_BATCH_SIZE = 10000
+
+# ⏳ Délai avant qu'une alerte reçue soit éligible au traitement
+PENDING_ALERT_DELAY = 66
+
+# The status is a literal (not a parameter) so the planner can match the
+# partial index idx_alerts_pending even with a cached generic plan
+_SQL_PENDING_ALERTS = f"""
+    SELECT alert_hash, payload 
+    FROM alerts 
+    WHERE status = 'received' 
+    AND created_at < NOW() - INTERVAL '{PENDING_ALERT_DELAY} seconds'
+    ORDER BY created_at ASC
+    LIMIT $1
+"""
+
+# 🔒 Bail d'une alerte 'processing': elle en sort dès que ENRICHED ou FAILED est écrit par
+# le writer en lot, donc après l'enrichissement (appels Datadog et K8s). Encore 'processing'
+# au-delà du bail = instance arrêtée en cours d'enrichissement: l'alerte est réclamée à nouveau
+PROCESSING_LEASE = 120
+# Chaque réclamation incrémente retry_count; au-delà de ce nombre de tentatives, une alerte
+# dont le bail a expiré passe en 'failed' au lieu d'être réclamée indéfiniment
+MAX_PROCESSING_ATTEMPTS = 3
+
+# Claims the eligible backlog atomically: SKIP LOCKED lets several instances poll the
+# same table without two of them picking up the same alert. Stale 'processing' rows
+# (lease expired) are claimed again via idx_alerts_status_updated, or failed once
+# they have used up their attempts
+_SQL_CLAIM_PENDING_ALERTS = f"""
+    WITH exhausted AS (
+        UPDATE alerts
+        SET status = 'failed',
+            updated_at = NOW(),
+            error_message = 'Processing lease expired after {MAX_PROCESSING_ATTEMPTS} attempts'
+        WHERE status = 'processing'
+        AND updated_at < NOW() - INTERVAL '{PROCESSING_LEASE} seconds'
+        AND retry_count >= {MAX_PROCESSING_ATTEMPTS}
+    )
+    UPDATE alerts AS a
+    SET status = 'processing',
+        updated_at = NOW(),
+        retry_count = a.retry_count + 1
+    FROM (
+        SELECT alert_hash
+        FROM alerts
+        WHERE (status = 'received'
+               AND created_at < NOW() - INTERVAL '{PENDING_ALERT_DELAY} seconds')
+        OR (status = 'processing'
+            AND updated_at < NOW() - INTERVAL '{PROCESSING_LEASE} seconds'
+            AND retry_count < {MAX_PROCESSING_ATTEMPTS})
+        ORDER BY created_at ASC
+        LIMIT $1
+        FOR UPDATE SKIP LOCKED
+    ) AS pending
+    WHERE a.alert_hash = pending.alert_hash
+    RETURNING a.alert_hash, a.payload
+"""
+
+# Status counts and the 10 most recent alerts in a single round trip (and snapshot);
+# rows are told apart by the `kind` column
+_SQL_ALERT_STATISTICS = """
+    WITH stats AS (
+        SELECT 'stat' AS kind, NULL::varchar AS alert_hash, status, COUNT(*) AS count,
+               NULL::timestamp AS created_at, NULL::timestamp AS updated_at
+        FROM alerts
+        GROUP BY status
+    ), recent AS (
+        SELECT 'recent' AS kind, alert_hash, status, NULL::bigint AS count,
+               created_at, updated_at
+        FROM alerts
+        ORDER BY created_at DESC
+        LIMIT 10
+    )
+    SELECT * FROM stats
+    UNION ALL
+    SELECT * FROM recent
+"""
+
+def _encode_jsonb(value: Any) -> bytes:
+    """Encode a Python object to the binary JSONB wire format (version byte + JSON)"""
+    return b"\x01" + orjson.dumps(value, default=str)
+
+def _decode_jsonb(data: bytes) -> Any:
+    """Decode the binary JSONB wire format"""
+    return orjson.loads(data[1:])
+
+async def _init_connection(conn: asyncpg.Connection) -> None:
+    """Register the orjson JSONB codec on every new pool connection"""
+    await conn.set_type_codec(
+        "jsonb",
+        encoder=_encode_jsonb,
+        decoder=_decode_jsonb,
+        schema="pg_catalog",
+        format="binary"
+    )
+
 class AlertStatus(Enum):
     """Enumeration for alert status values"""
     RECEIVED = "received"
@@ -28,6 +165,8 @@ class AlertDatabase:
     def __init__(self):
         self.pool: asyncpg.Pool | None = None
         self._config = self._get_db_config()
+        self._update_queue: asyncio.Queue | None = None
+        self._writer_task: asyncio.Task | None = None
     
     def _get_db_config(self) -> Dict[str, Any]:
         """Get database configuration from environment variables"""
@@ -62,6 +201,9 @@ class AlertDatabase:
                 min_size=2,
                 max_size=10,
                 command_timeout=30,  # Timeout pour les commandes (30 secondes)
+                statement_cache_size=1024,
+                max_cached_statement_lifetime=0,  # Ne jamais re-préparer les requêtes chaudes
+                init=_init_connection,  # JSONB <-> dict via orjson, sans json.dumps côté appelant
                 server_settings={
                     'application_name': 'k-fix-agent',
                     'tcp_keepalives_idle': '600',
@@ -73,6 +215,10 @@ class AlertDatabase:
             # Create tables if they don't exist
             await self._create_tables()
             
+            # ✍️ Writer unique pour les mises à jour de statut (hors du chemin critique)
+            self._update_queue = asyncio.Queue()
+            self._writer_task = asyncio.create_task(self._drain_status_updates())
+            
             logger.info("✅ Database initialized successfully")
             
         except ValueError as e:
@@ -86,43 +232,45 @@ class AlertDatabase:
     async def _create_tables(self) -> None:
         """Create database tables and indexes"""
         try:
-            conn = await asyncio.wait_for(self.pool.acquire(), timeout=10.0)
+            conn = await self.pool.acquire(timeout=10.0)
             try:
                 async with conn.transaction():
                     # Create alerts table
-                    await asyncio.wait_for(
-                        conn.execute("""
-                            CREATE TABLE IF NOT EXISTS alerts (
-                                alert_hash VARCHAR(64) PRIMARY KEY,
-                                payload JSONB NOT NULL,
-                                enriched_data JSONB NULL,
-                                status VARCHAR(20) DEFAULT 'received',
-                                created_at TIMESTAMP DEFAULT NOW(),
-                                updated_at TIMESTAMP DEFAULT NOW(),
-                                processed_at TIMESTAMP NULL,
-                                retry_count INTEGER DEFAULT 0,
-                                error_message TEXT NULL
-                            );
-                        """),
-                        timeout=15.0
-                    )
+                    await conn.execute("""
+                        CREATE TABLE IF NOT EXISTS alerts (
+                            alert_hash VARCHAR(64) PRIMARY KEY,
+                            payload JSONB NOT NULL,
+                            enriched_data JSONB NULL,
+                            status VARCHAR(20) DEFAULT 'received',
+                            created_at TIMESTAMP DEFAULT NOW(),
+                            updated_at TIMESTAMP DEFAULT NOW(),
+                            processed_at TIMESTAMP NULL,
+                            retry_count INTEGER DEFAULT 0,
+                            error_message TEXT NULL
+                        );
+                    """, timeout=15.0)
                     
                     # Create indexes
-                    await asyncio.wait_for(
-                        conn.execute("""
-                            CREATE INDEX IF NOT EXISTS idx_alerts_status_created 
-                            ON alerts(status, created_at);
-                        """),
-                        timeout=10.0
-                    )
+                    # Partial index: only the 'received' backlog polled by get_pending_alerts
+                    await conn.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_alerts_pending 
+                        ON alerts(created_at) WHERE status = 'received';
+                    """, timeout=10.0)
+                    
+                    # Superseded by idx_alerts_pending
+                    await conn.execute("""
+                        DROP INDEX IF EXISTS idx_alerts_status_created;
+                    """, timeout=10.0)
                     
-                    await asyncio.wait_for(
-                        conn.execute("""
-                            CREATE INDEX IF NOT EXISTS idx_alerts_hash 
-                            ON alerts(alert_hash);
-                        """),
-                        timeout=10.0
-                    )
+                    await conn.execute("""
+                        CREATE INDEX IF NOT EXISTS idx_alerts_status_updated 
+                        ON alerts(status, updated_at);
+                    """, timeout=10.0)
+                    
+                    # alert_hash est déjà couvert par la PRIMARY KEY: supprimer l'ancien doublon
+                    await conn.execute("""
+                        DROP INDEX IF EXISTS idx_alerts_hash;
+                    """, timeout=10.0)
                     
                 logger.info("✅ Database tables created successfully")
             finally:
@@ -136,7 +284,15 @@ class AlertDatabase:
             raise
     
     async def close(self) -> None:
-        """Close database connection pool"""
+        """Flush pending status updates and close database connection pool"""
+        if self._writer_task:
+            try:
+                await asyncio.wait_for(self.flush_updates(), timeout=5.0)
+            except asyncio.TimeoutError:
+                logger.warning(f"⚠️ Timeout flushing status updates, {self._update_queue.qsize()} dropped")
+            self._writer_task.cancel()
+            self._writer_task = None
+        
         if self.pool:
             try:
                 await asyncio.wait_for(self.pool.close(), timeout=5.0)
@@ -146,118 +302,110 @@ class AlertDatabase:
             except Exception as e:
                 logger.error(f"❌ Error closing database pool: {e}")
     
-    async def is_alert_received(self, alert_hash: str) -> bool:
-        """Check if alert has already been received"""
-        try:
-            async with self.pool.acquire() as conn:
-                result = await asyncio.wait_for(
-                    conn.fetchval(
-                        "SELECT alert_hash FROM alerts WHERE alert_hash = $1",
-                        alert_hash
-                    ),
-                    timeout=10.0
-                )
-                return result is not None
-        except asyncio.TimeoutError:
-            logger.error(f"❌ Timeout checking alert {alert_hash[:8]}")
-            return False
-        except Exception as e:
-            logger.error(f"❌ Error checking alert {alert_hash[:8]}: {e}")
-            return False
-    
-    async def save_alert(self, payload: Dict[str, Any], alert_hash: str) -> str:
-        """Save alert to database and return alert_hash"""
+    async def save_alert(self, payload: Dict[str, Any], alert_hash: str, raw_payload: bytes | None = None) -> str | None:
+        """
+        Save alert to database and return alert_hash, or None if it was already received
+        raw_payload: corps JSON reçu tel quel, écrit sans re-sérialiser payload
+        """
+        # ⚡ Le JSON d'origine est inséré tel quel (orjson.Fragment) au lieu d'être ré-encodé
+        value = orjson.Fragment(raw_payload) if raw_payload is not None else payload
         try:
-            async with self.pool.acquire() as conn:
-                await asyncio.wait_for(
-                    conn.execute("""
-                        INSERT INTO alerts (alert_hash, payload) 
-                        VALUES ($1, $2)
-                        ON CONFLICT (alert_hash) DO NOTHING
-                    """, alert_hash, json.dumps(payload)),
-                    timeout=10.0
-                )
+            async with self.pool.acquire(timeout=5.0) as conn:
+                inserted = await conn.fetchval(_SQL_INSERT_ALERT, alert_hash, value, timeout=10.0)
+            if inserted is None:
+                logger.info(f"🔄 Alert {alert_hash[:8]} already received")
+                return None
             logger.info(f"💾 Alert {alert_hash[:8]} saved to database")
-            return alert_hash
+            return inserted
         except Exception as e:
             logger.error(f"❌ Failed to save alert {alert_hash[:8]}: {e}")
             raise
     
     async def update_alert_status(self, alert_hash: str, status: AlertStatus, error_message: str = None, enriched_data: Dict[str, Any] = None) -> None:
-        """Update alert status with optional enriched data"""
-        try:
-            async with self.pool.acquire() as conn:
-                if status == AlertStatus.RESOLVED:
-                    # For resolved status, set processed_at
-                    if enriched_data:
-                        await asyncio.wait_for(
-                            conn.execute("""
-                                UPDATE alerts 
-                                SET status = $1, updated_at = NOW(), processed_at = NOW(), enriched_data = $2
-                                WHERE alert_hash = $3
-                            """, str(status), json.dumps(enriched_data), alert_hash),
-                            timeout=10.0
-                        )
-                    else:
-                        await asyncio.wait_for(
-                            conn.execute("""
-                                UPDATE alerts 
-                                SET status = $1, updated_at = NOW(), processed_at = NOW()
-                                WHERE alert_hash = $2
-                            """, str(status), alert_hash),
-                            timeout=10.0
-                        )
-                else:
-                    # For other statuses
-                    if enriched_data:
-                        await asyncio.wait_for(
-                            conn.execute("""
-                                UPDATE alerts 
-                                SET status = $1, updated_at = NOW(), enriched_data = $2, error_message = $3,
-                                    retry_count = retry_count + 1
-                                WHERE alert_hash = $4
-                            """, str(status), json.dumps(enriched_data), error_message, alert_hash),
-                            timeout=10.0
-                        )
-                    else:
-                        await asyncio.wait_for(
-                            conn.execute("""
-                                UPDATE alerts 
-                                SET status = $1, updated_at = NOW(), error_message = $2,
-                                    retry_count = retry_count + 1
-                                WHERE alert_hash = $3
-                            """, str(status), error_message, alert_hash),
-                            timeout=10.0
-                        )
-                    
-            if enriched_data:
-                logger.info(f"📊 Alert {alert_hash[:8]} status updated to {status.value} with enriched data")
-            else:
-                logger.info(f"📝 Alert {alert_hash[:8]} status updated to {status.value}")
+        """Queue an alert status update (optionally with enriched data) for the batch writer"""
+        update = (alert_hash, status, error_message, enriched_data or None)
+        if self._update_queue is None:
+            # Writer pas démarré: écriture directe
+            await self._write_status_updates([update])
+            return
+        self._update_queue.put_nowait(update)
+    
+    async def flush_updates(self) -> None:
+        """Wait until every queued status update has been written"""
+        if self._update_queue is not None:
+            await self._update_queue.join()
+    
+    async def _drain_status_updates(self) -> None:
+        """Background writer: group queued status updates into batched UPDATEs"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._update_queue.get()]
+            deadline = loop.time() + STATUS_FLUSH_INTERVAL
+            while len(batch) < STATUS_BATCH_SIZE:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._update_queue.get(), timeout=remaining))
+                except asyncio.TimeoutError:
+                    break
             
+            try:
+                await self._write_status_updates(batch)
+            finally:
+                for _ in batch:
+                    self._update_queue.task_done()
+    
+    async def _write_status_updates(self, updates: List[Tuple[str, AlertStatus, str | None, Dict[str, Any] | None]]) -> None:
+        """Apply status updates in one statement, coalescing successive updates of the same alert"""
+        # Mêmes règles que des UPDATE successifs: dernier statut, dernières données non nulles
+        merged: Dict[str, Dict[str, Any]] = {}
+        for alert_hash, status, error_message, enriched_data in updates:
+            row = merged.setdefault(alert_hash, {"enriched_data": None, "error_message": None, "resolved": False, "retries": 0})
+            row["status"] = status
+            if enriched_data is not None:
+                row["enriched_data"] = enriched_data
+            if error_message is not None:
+                row["error_message"] = error_message
+            if status == AlertStatus.RESOLVED:
+                row["resolved"] = True
+            else:
+                row["retries"] += 1
+        
+        hashes = list(merged)
+        rows = list(merged.values())
+        try:
+            async with self.pool.acquire(timeout=5.0) as conn:
+                await conn.execute(
+                    _SQL_UPDATE_ALERT_STATUS_BATCH,
+                    hashes,
+                    [str(row["status"]) for row in rows],
+                    [row["enriched_data"] for row in rows],
+                    [row["error_message"] for row in rows],
+                    [row["resolved"] for row in rows],
+                    [row["retries"] for row in rows],
+                    timeout=10.0
+                )
         except Exception as e:
-            logger.error(f"❌ Failed to update alert {alert_hash[:8]} status: {e}")
+            logger.error(f"❌ Failed to update status of {len(hashes)} alerts: {e}")
+            return
+        
+        for alert_hash, row in merged.items():
+            if row["enriched_data"]:
+                logger.info(f"📊 Alert {alert_hash[:8]} status updated to {row['status'].value} with enriched data")
+            else:
+                logger.info(f"📝 Alert {alert_hash[:8]} status updated to {row['status'].value}")
     
     async def get_pending_alerts(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get alerts that need processing (received > 1 minute ago)"""
         try:
-            async with self.pool.acquire() as conn:
-                alerts = await asyncio.wait_for(
-                    conn.fetch("""
-                        SELECT alert_hash, payload 
-                        FROM alerts 
-                        WHERE status = $1 
-                        AND created_at < NOW() - INTERVAL '66 seconds'
-                        ORDER BY created_at ASC
-                        LIMIT $2
-                    """, str(AlertStatus.RECEIVED), limit),
-                    timeout=15.0
-                )
+            async with self.pool.acquire(timeout=5.0) as conn:
+                alerts = await conn.fetch(_SQL_PENDING_ALERTS, limit, timeout=15.0)
                 
                 return [
                     {
                         "alert_hash": alert['alert_hash'],
-                        "payload": json.loads(alert['payload'])
+                        "payload": alert['payload']
                     }
                     for alert in alerts
                 ]
@@ -265,32 +413,30 @@ class AlertDatabase:
             logger.error(f"❌ Error getting pending alerts: {e}")
             return []
     
+    async def claim_pending_alerts(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Mark eligible alerts as processing and return them; alerts claimed by another instance are skipped"""
+        try:
+            async with self.pool.acquire(timeout=5.0) as conn:
+                alerts = await conn.fetch(_SQL_CLAIM_PENDING_ALERTS, limit, timeout=15.0)
+                
+                return [
+                    {
+                        "alert_hash": alert['alert_hash'],
+                        "payload": alert['payload']
+                    }
+                    for alert in alerts
+                ]
+        except Exception as e:
+            logger.error(f"❌ Error claiming pending alerts: {e}")
+            return []
+    
     async def get_alert_statistics(self) -> Dict[str, Any]:
         """Get database statistics for monitoring"""
         try:
-            async with self.pool.acquire() as conn:
-                # Get counts by status
-                stats = await asyncio.wait_for(
-                    conn.fetch("""
-                        SELECT status, COUNT(*) as count
-                        FROM alerts
-                        GROUP BY status
-                    """),
-                    timeout=10.0
-                )
+            async with self.pool.acquire(timeout=5.0) as conn:
+                rows = await conn.fetch(_SQL_ALERT_STATISTICS, timeout=10.0)
                 
-                # Get recent alerts
-                recent = await asyncio.wait_for(
-                    conn.fetch("""
-                        SELECT alert_hash, status, created_at, updated_at
-                        FROM alerts
-                        ORDER BY created_at DESC
-                        LIMIT 10
-                    """),
-                    timeout=10.0
-                )
-                
-                status_counts = {row['status']: row['count'] for row in stats}
+                status_counts = {row['status']: row['count'] for row in rows if row['kind'] == 'stat'}
                 recent_alerts = [
                     {
                         "hash": row['alert_hash'][:8],
@@ -298,7 +444,7 @@ class AlertDatabase:
                         "created": row['created_at'].isoformat(),
                         "updated": row['updated_at'].isoformat()
                     }
-                    for row in recent
+                    for row in rows if row['kind'] == 'recent'
                 ]
                 
                 return {
@@ -316,22 +462,23 @@ class AlertDatabase:
     async def cleanup_old_alerts(self, days: int = 30) -> int:
         """Clean up old resolved alerts (optional maintenance method)"""
         try:
-            async with self.pool.acquire() as conn:
-                # ✅ CORRECTION: Utilisation des énumérations avec paramètres sécurisés
-                result = await asyncio.wait_for(
-                    conn.execute("""
-                        DELETE FROM alerts 
-                        WHERE status IN ($1, $2) 
-                        AND updated_at < NOW() - INTERVAL '$3 days'
-                    """, str(AlertStatus.RESOLVED), str(AlertStatus.FAILED), str(days)),
-                    timeout=30.0
-                )
+            async with self.pool.acquire(timeout=5.0) as conn:
+                statuses = [str(AlertStatus.RESOLVED), str(AlertStatus.FAILED)]
+                deleted_count = 0
                 
-                # Extraction sécurisée du nombre de lignes supprimées
-                try:
-                    deleted_count = int(result.split()[-1]) if result else 0
-                except (ValueError, IndexError):
-                    deleted_count = 0
+                # Supprimer par lots jusqu'à épuisement des lignes éligibles
+                while True:
+                    result = await conn.execute(_SQL_DELETE_OLD_ALERTS_BATCH, statuses, days, CLEANUP_BATCH_SIZE, timeout=30.0)
+                    
+                    # Extraction sécurisée du nombre de lignes supprimées
+                    try:
+                        batch_count = int(result.split()[-1]) if result else 0
+                    except (ValueError, IndexError):
+                        batch_count = 0
+                    
+                    deleted_count += batch_count
+                    if batch_count < CLEANUP_BATCH_SIZE:
+                        break
                 
                 logger.info(f"🧹 Cleaned up {deleted_count} old alerts")
                 return deleted_count
@@ -346,12 +493,9 @@ class AlertDatabase:
     async def get_connection_health(self) -> Dict[str, Any]:
         """Check database connection health with timeout"""
         try:
-            async with self.pool.acquire() as conn:
+            async with self.pool.acquire(timeout=5.0) as conn:
                 start_time = datetime.now()
-                await asyncio.wait_for(
-                    conn.fetchval("SELECT 1"),
-                    timeout=5.0
-                )
+                await conn.fetchval("SELECT 1", timeout=5.0)
                 response_time = (datetime.now() - start_time).total_seconds()
                 
                 return {
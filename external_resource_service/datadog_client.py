@@ -1,20 +1,59 @@
 import os
-import logging
 import asyncio
+import logging
 import datetime
 from typing import Dict, Any
-from datadog_api_client import ApiClient, Configuration
+import aiosonic
+from aiosonic.pools import PoolConfig
+from datadog_api_client import AsyncApiClient, Configuration, rest
 from datadog_api_client.v2.api.events_api import EventsApi
 from datadog_api_client.exceptions import NotFoundException
 from datadog_api_client.v2.model.v2_event_response import V2EventResponse
 
 logger = logging.getLogger(__name__)
 
+# Connexions keep-alive max du pool aiosonic partagé par toutes les requêtes Datadog
+# (réglable via DD_POOL_MAXSIZE; rester modeste pour ne pas inonder l'API)
+DEFAULT_DATADOG_POOL_MAXSIZE = 32
+# Attente max des requêtes en cours à la fermeture du pool
+DATADOG_CLOSE_TIMEOUT = 5.0
+
+
+class _PooledRESTClientObject(rest.AsyncRESTClientObject):
+    """AsyncRESTClientObject on a caller-provided aiosonic.HTTPClient"""
+
+    def __init__(self, configuration: Configuration, http_client: aiosonic.HTTPClient):
+        # Pas de super().__init__(): il créerait un second HTTPClient, jamais fermé
+        self._client = http_client
+        self._configuration = configuration
+
+
+class _PooledAsyncApiClient(AsyncApiClient):
+    """AsyncApiClient (aiosonic) with an explicitly sized connection pool, closed by close()"""
+
+    def _build_rest_client(self):
+        proxy = None
+        if self.configuration.proxy:
+            proxy = aiosonic.Proxy(self.configuration.proxy, self.configuration.proxy_headers)
+        pool_size = int(os.getenv("DD_POOL_MAXSIZE", DEFAULT_DATADOG_POOL_MAXSIZE))
+        self.http_client = aiosonic.HTTPClient(
+            connector=aiosonic.TCPConnector(pool_configs={":default": PoolConfig(size=pool_size)}),
+            proxy=proxy,
+            verify_ssl=self.configuration.verify_ssl,
+        )
+        return _PooledRESTClientObject(self.configuration, self.http_client)
+
+    async def close(self):
+        """Ferme les connexions keep-alive du pool (AsyncRESTClientObject.close() ne fait rien)"""
+        await asyncio.wait_for(self.http_client.connector.cleanup(), timeout=DATADOG_CLOSE_TIMEOUT)
+
+
 class DatadogClientManager:
     """Manager for Datadog API client with connection reuse"""
     
     def __init__(self):
-        self._client: ApiClient | None = None
+        self._client: AsyncApiClient | None = None
+        self._events_api: EventsApi | None = None
         self._config: Configuration | None = None
     
     def _get_datadog_config(self) -> Configuration:
@@ -34,24 +73,38 @@ class DatadogClientManager:
                 server_variables={
                     "site": os.getenv("DD_SITE", "datadoghq.eu"),
                 },
+                # Réponses gzip/deflate acceptées (explicite: c'est ce qui réduit le payload des events)
+                compress=True,
             )
             logger.info("🔧 Datadog configuration created")
         
         return self._config
     
-    def get_client(self) -> ApiClient:
+    def get_client(self) -> AsyncApiClient:
         """Returns a reusable Datadog API client"""
         if self._client is None:
-            self._client = ApiClient(self._get_datadog_config())
+            # Appelé uniquement depuis la boucle d'événements, sans await: pas de course possible,
+            # un seul client (et un seul pool keep-alive) par process
+            self._client = _PooledAsyncApiClient(self._get_datadog_config())
             logger.info("🔗 Datadog API client created")
         return self._client
     
-    def close(self):
-        """Close the Datadog API client"""
-        if self._client:
-            self._client.close()
-            self._client = None
-            logger.info("🔌 Datadog API client closed")
+    def get_events_api(self) -> EventsApi:
+        """Returns the Events API bound to the shared client (built once)"""
+        events_api = self._events_api
+        if events_api is None:
+            events_api = self._events_api = EventsApi(self.get_client())
+        return events_api
+    
+    async def close(self):
+        """Close the Datadog API client and its connection pool"""
+        client, self._client, self._events_api = self._client, None, None
+        if client:
+            try:
+                await client.close()
+                logger.info("🔌 Datadog API client closed")
+            except asyncio.TimeoutError:
+                logger.warning("⚠️ Timeout while closing Datadog connection pool")
     
     def is_connected(self) -> bool:
         """Check if client is connected"""
@@ -60,9 +113,9 @@ class DatadogClientManager:
     async def get_runtime_event(self, event_id: int) -> Dict[str, Any]:
         """Retrieve runtime event details from Datadog"""
         try:
-            client = self.get_client()
-            events_api = EventsApi(client)
-            event_response: V2EventResponse = events_api.get_event(event_id=str(event_id))
+            events_api = self.get_events_api()
+            # Client async (aiosonic): l'attente HTTP est multiplexée par la boucle, sans thread
+            event_response: V2EventResponse = await events_api.get_event(event_id=str(event_id))
             
             return {
                 "event_id": event_id,
@@ -77,7 +130,7 @@ class DatadogClientManager:
                 "event_id": event_id,
                 "title": "Event not found",
                 "message": "This event could not be retrieved from Datadog",
-                "timestamp": datetime.datetime.now(),
+                "timestamp": datetime.datetime.now(datetime.timezone.utc),
                 "tags": []
             }
 
@@ -1,14 +1,21 @@
-from kubernetes import client, config
+from kubernetes_asyncio import client, config
+import asyncio
 import logging
+import os
 import threading
 from typing import Optional, Tuple
 
 logger = logging.getLogger(__name__)
 
+# 🔌 Connexions simultanées max vers l'API server (limite du TCPConnector aiohttp)
+DEFAULT_K8S_POOL_MAXSIZE = 100
+
 class K8sClientManager:
     """singleton"""
     _instance = None
     _lock = threading.Lock()
+    _init_lock = asyncio.Lock()
+    _api_client: Optional[client.ApiClient] = None
     _v1_client: Optional[client.CoreV1Api] = None
     _apps_v1_client: Optional[client.AppsV1Api] = None
     _config_loaded = False
@@ -20,11 +27,11 @@ class K8sClientManager:
                     cls._instance = super().__new__(cls)
         return cls._instance
     
-    def _load_config_once(self):
+    async def _load_config_once(self):
         """Charge la configuration Kubernetes une seule fois"""
         if not self._config_loaded:
             try:
-                config.load_kube_config()
+                await config.load_kube_config()
                 logger.info("✅ Kubernetes config loaded from kubeconfig")
             except Exception as e:
                 logger.warning(f"⚠️ Failed to load kubeconfig: {e}")
@@ -36,25 +43,42 @@ class K8sClientManager:
                     raise e2
             self._config_loaded = True
     
-    def get_clients(self) -> Tuple[client.CoreV1Api, client.AppsV1Api]:
+    @staticmethod
+    def _build_configuration() -> client.Configuration:
+        """Copie de la config chargée, avec la taille du pool réglable via K8S_POOL_MAXSIZE"""
+        cfg = client.Configuration.get_default_copy()
+        cfg.connection_pool_maxsize = int(os.getenv("K8S_POOL_MAXSIZE", DEFAULT_K8S_POOL_MAXSIZE))
+        return cfg
+    
+    async def get_clients(self) -> Tuple[client.CoreV1Api, client.AppsV1Api]:
         """Retourne les clients Kubernetes réutilisables"""
         if self._v1_client is None or self._apps_v1_client is None:
-            with self._lock:
+            async with self._init_lock:
                 if self._v1_client is None or self._apps_v1_client is None:
-                    self._load_config_once()
-                    self._v1_client = client.CoreV1Api()
-                    self._apps_v1_client = client.AppsV1Api()
+                    await self._load_config_once()
+                    # Un seul ApiClient partagé: un seul pool de connexions keep-alive
+                    self._api_client = client.ApiClient(self._build_configuration())
+                    self._v1_client = client.CoreV1Api(self._api_client)
+                    self._apps_v1_client = client.AppsV1Api(self._api_client)
                     logger.info("🔧 Kubernetes clients initialized")
         
         return self._v1_client, self._apps_v1_client
     
-    def reset_clients(self):
-        """Reset les clients (utile pour les tests ou reconnexion)"""
-        with self._lock:
+    async def close(self):
+        """Ferme le pool de connexions partagé"""
+        async with self._init_lock:
+            if self._api_client is not None:
+                await self._api_client.close()
+                logger.info("🔌 Kubernetes API client closed")
+            self._api_client = None
             self._v1_client = None
             self._apps_v1_client = None
-            self._config_loaded = False
-            logger.info("🔄 Kubernetes clients reset")
+    
+    async def reset_clients(self):
+        """Reset les clients (utile pour les tests ou reconnexion); l'ancien pool est fermé"""
+        await self.close()
+        self._config_loaded = False
+        logger.info("🔄 Kubernetes clients reset")
     
     def is_initialized(self) -> bool:
         """Vérifie si les clients sont initialisés"""
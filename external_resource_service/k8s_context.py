@@ -1,7 +1,9 @@
-from kubernetes import client, config
+from kubernetes_asyncio import client
 import logging
 from typing import Dict, Any
 import asyncio
+import orjson
+from cachetools import TTLCache
 from .k8s_client_manager import K8sClientManager
 
 logger = logging.getLogger(__name__)
@@ -9,18 +11,95 @@ logger = logging.getLogger(__name__)
 # Instance globale du gestionnaire
 k8s_manager = K8sClientManager()
 
+# ⏱️ Caches: pod/events changent en secondes, un deployment en minutes
+POD_CONTEXT_TTL = 5
+DEPLOYMENT_CONTEXT_TTL = 60
+STALE_CONTEXT_MAX_AGE = 600
+
+# ⏱️ Timeout explicite (secondes) sur chaque appel à l'API server: sans lui une
+# connexion bloquée suspend l'enrichissement indéfiniment
+K8S_REQUEST_TIMEOUT = 10
+
+# 🚦 Requêtes simultanées max lors du scan namespace par namespace
+NAMESPACE_SCAN_CONCURRENCY = 20
+
+# 🏷️ Labels dont la valeur porte habituellement le nom du deployment (par priorité)
+DEPLOYMENT_NAME_LABELS = ("app.kubernetes.io/name", "app", "k8s-app")
+
+# 🔍 Pods homonymes (namespaces différents) remontés par la recherche cluster-wide
+DISCOVERY_POD_LIMIT = 5
+
+_context_cache = TTLCache(maxsize=1024, ttl=POD_CONTEXT_TTL)
+_deployment_cache = TTLCache(maxsize=1024, ttl=DEPLOYMENT_CONTEXT_TTL)
+# Dernier contexte valide connu, servi si l'API server est injoignable
+_last_known_context = TTLCache(maxsize=1024, ttl=STALE_CONTEXT_MAX_AGE)
+# (namespace, replicaset) -> deployment propriétaire (None si aucun)
+_replicaset_owner_cache = TTLCache(maxsize=1024, ttl=DEPLOYMENT_CONTEXT_TTL)
+# 🔁 Alertes en rafale sur le même pod: nom du pod -> namespace, uid du pod -> deployment
+_pod_namespace_cache = TTLCache(maxsize=1024, ttl=DEPLOYMENT_CONTEXT_TTL)
+_pod_deployment_cache = TTLCache(maxsize=1024, ttl=DEPLOYMENT_CONTEXT_TTL)
+_namespace_names_cache = TTLCache(maxsize=1, ttl=DEPLOYMENT_CONTEXT_TTL)
+# Récupérations en cours, partagées par les appels concurrents sur le même pod
+_inflight_contexts: Dict[tuple, asyncio.Future] = {}
+
 async def get_k8s_context(namespace: str = None, pod_name: str = None, deployment_name: str = None) -> Dict[str, Any]:
-    """Get Kubernetes context for a pod and its deployment"""
+    """
+    Get Kubernetes context for a pod and its deployment (cached for a few seconds)
+    Chaque appelant reçoit sa propre copie de premier niveau; les valeurs imbriquées
+    (pod, deployment, events) sont partagées avec le cache et ne doivent pas être modifiées
+    """
+    cache_key = (namespace, pod_name, deployment_name)
+    
+    cached = _context_cache.get(cache_key)
+    if cached is not None:
+        logger.debug(f"⚡ Kubernetes context cache hit for {pod_name}")
+        return dict(cached)
     
-    # Exécuter les appels bloquants dans un thread séparé
-    loop = asyncio.get_event_loop()
-    return await loop.run_in_executor(None, _sync_get_k8s_context, namespace, pod_name, deployment_name)
+    # 🔀 Même pod déjà en cours de récupération (alertes en rafale): on attend ce résultat
+    inflight = _inflight_contexts.get(cache_key)
+    if inflight is not None:
+        logger.debug(f"🔀 Kubernetes context request for {pod_name} coalesced with an in-flight call")
+        return dict(await asyncio.shield(inflight))
+    
+    future = asyncio.get_running_loop().create_future()
+    _inflight_contexts[cache_key] = future
+    try:
+        context = await _get_k8s_context_uncached(cache_key, namespace, pod_name, deployment_name)
+        future.set_result(context)
+        return dict(context)
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # Marquée comme lue: pas d'avertissement asyncio sans autre appelant
+        raise
+    finally:
+        del _inflight_contexts[cache_key]
+        if not future.done():
+            # Appelant annulé: les requêtes en attente sont annulées aussi
+            future.cancel()
+
+async def _get_k8s_context_uncached(cache_key: tuple, namespace: str, pod_name: str, deployment_name: str) -> Dict[str, Any]:
+    """Fetch the context from the API server, falling back to the last known one"""
+    try:
+        context = await _fetch_k8s_context(namespace, pod_name, deployment_name)
+    except Exception as e:
+        stale = _last_known_context.get(cache_key)
+        if stale is None:
+            raise
+        logger.warning(f"⚠️ Kubernetes API unreachable ({e}), using last known context for {pod_name}")
+        return {**stale, "stale": True}
+    
+    # Ne mettre en cache que les contextes où le pod a été trouvé
+    if context["pod"] and "error" not in context["pod"]:
+        _context_cache[cache_key] = context
+        _last_known_context[cache_key] = context
+    
+    return context
 
-def _sync_get_k8s_context(namespace: str = None, pod_name: str = None, deployment_name: str = None) -> Dict[str, Any]:
-    """Version synchrone pour exécution dans un thread séparé"""
+async def _fetch_k8s_context(namespace: str = None, pod_name: str = None, deployment_name: str = None) -> Dict[str, Any]:
+    """Query the API server for pod, deployment and events"""
     
-    # 🚀 Utiliser les clients réutilisables
-    v1, apps_v1 = k8s_manager.get_clients()
+    # 🚀 Utiliser les clients réutilisables (kubernetes_asyncio, non bloquant)
+    v1, apps_v1 = await k8s_manager.get_clients()
 
     context = {
         "pod": {},
@@ -32,35 +111,40 @@ def _sync_get_k8s_context(namespace: str = None, pod_name: str = None, deploymen
     # 🔍 Si on a seulement le nom du pod, on fait une découverte complète
     if pod_name and not namespace:
         logger.info(f"🔍 Discovering pod {pod_name} across all namespaces...")
-        discovery_result = _discover_pod_automatically(v1, apps_v1, pod_name)
+        discovery_result = await _discover_pod_automatically(v1, apps_v1, pod_name)
         context.update(discovery_result)
     else:
         # 📋 Méthode classique si on a le namespace
-        pod_context = _get_pod_context_with_fallback(v1, namespace or "default", pod_name)
+        namespace = namespace or "default"
+        
+        # ⚡ Pod (suivi de la découverte de son deployment), deployment connu et events en parallèle
+        pod_result, deployment_result, events_result = await asyncio.gather(
+            _get_pod_and_discovered_deployment(v1, apps_v1, namespace, pod_name, discover=not deployment_name),
+            _get_deployment_context(apps_v1, namespace, deployment_name) if deployment_name else asyncio.sleep(0, result={}),
+            _get_pod_events(v1, namespace, pod_name) if pod_name else asyncio.sleep(0, result=[]),
+            return_exceptions=True
+        )
+        
+        if isinstance(pod_result, Exception):
+            raise pod_result
+        pod_context, discovered_deployment = pod_result
         context["pod"] = pod_context
         
         # ⚠️ Vérifier si le pod a été trouvé avant de continuer
         if pod_context and "error" not in pod_context:
-            # 🔍 Si on n'a pas de deployment_name, on essaie de le découvrir
-            if deployment_name:
-                context["deployment"] = _get_deployment_context(apps_v1, namespace or "default", deployment_name)
-            elif "name" in pod_context:
-                # Utiliser les infos du pod déjà récupéré
-                try:
-                    pod = v1.read_namespaced_pod(name=pod_context["name"], namespace=pod_context["namespace"])
-                    discovered_deployment = _discover_deployment_from_pod(apps_v1, pod)
-                    if discovered_deployment:
-                        context["deployment"] = _get_deployment_context(apps_v1, pod_context["namespace"], discovered_deployment)
-                        logger.info(f"🎯 Auto-discovered deployment: {discovered_deployment}")
-                    else:
-                        context["deployment"] = {"error": "No deployment found for this pod"}
-                except Exception as e:
-                    logger.error(f"❌ Error discovering deployment: {e}")
-                    context["deployment"] = {"error": f"Discovery failed: {str(e)}"}
+            if not deployment_name:
+                context["deployment"] = discovered_deployment
+            elif isinstance(deployment_result, Exception):
+                logger.warning(f"⚠️ Failed to get deployment {deployment_name} in {namespace}: {deployment_result}")
+                context["deployment"] = {}
             else:
-                context["deployment"] = {"error": "No deployment name provided"}
+                context["deployment"] = deployment_result
             
-            context["events"] = _get_pod_events(v1, namespace or "default", pod_name)
+            if isinstance(events_result, Exception):
+                logger.warning(f"⚠️ Failed to get events for pod {pod_name} in {namespace}: {events_result}")
+                context["events"] = []
+            else:
+                context["events"] = events_result
         else:
             # Si le pod n'a pas été trouvé, pas la peine de chercher le deployment
             context["deployment"] = {"error": "Cannot find deployment without valid pod"}
@@ -68,7 +152,7 @@ def _sync_get_k8s_context(namespace: str = None, pod_name: str = None, deploymen
     
     return context
 
-def _discover_pod_automatically(v1, apps_v1, pod_name: str) -> dict:
+async def _discover_pod_automatically(v1, apps_v1, pod_name: str) -> dict:
     """
     Découverte automatique d'un pod dans tout le cluster
     Retourne pod, deployment, events et infos de découverte
@@ -80,87 +164,158 @@ def _discover_pod_automatically(v1, apps_v1, pod_name: str) -> dict:
         "found_deployment": None
     }
     
-    try:
-        # 🎯 Optimisation: chercher d'abord dans les namespaces communs
-        priority_namespaces = ["default", "kube-system", "monitoring", "logging"]
+    # Les erreurs d'API remontent: get_k8s_context sert alors le dernier contexte connu
+    # ⚡ 0. Namespace déjà résolu récemment: un simple GET sur le pod suffit
+    pod = None
+    cached_namespace = _pod_namespace_cache.get(pod_name)
+    if cached_namespace:
+        try:
+            pod = await v1.read_namespaced_pod(name=pod_name, namespace=cached_namespace, _request_timeout=K8S_REQUEST_TIMEOUT)
+            discovery_info["searched_namespaces"] = [cached_namespace]
+        except client.exceptions.ApiException as e:
+            logger.debug(f"🔍 Cached namespace {cached_namespace} no longer has pod {pod_name}: {e.status}")
+            _pod_namespace_cache.pop(pod_name, None)
+    
+    # 🔍 1. Un seul appel: l'API server filtre les pods par nom sur tout le cluster
+    if pod is None:
+        try:
+            discovery_info["searched_namespaces"] = ["<all>"]
+            pods = await v1.list_pod_for_all_namespaces(field_selector=f"metadata.name={pod_name}", limit=DISCOVERY_POD_LIMIT, _request_timeout=K8S_REQUEST_TIMEOUT)
+            # Même nom dans plusieurs namespaces: on garde le pod le plus récent
+            pod = max(pods.items, key=_pod_creation_key, default=None)
+        except client.exceptions.ApiException as e:
+            # RBAC sans droit de list cluster-wide → on sonde chaque namespace; autres erreurs: on remonte
+            if e.status != 403:
+                raise
+            logger.warning(f"⚠️ Cluster-wide pod lookup failed ({e.status}), scanning namespaces instead")
+            pod = await _find_pod_in_namespaces(v1, pod_name, discovery_info)
+    
+    if pod:
+        namespace_name = pod.metadata.namespace
+        _pod_namespace_cache[pod_name] = namespace_name
         
-        # 📋 1. Lister tous les namespaces
-        all_namespaces = v1.list_namespace()
-        namespace_names = [ns.metadata.name for ns in all_namespaces.items]
+        logger.info(f"✅ Found pod {pod_name} in namespace {namespace_name}")
+        discovery_info["found_namespace"] = namespace_name
         
-        # Réorganiser pour prioriser les namespaces communs
-        search_order = priority_namespaces + [ns for ns in namespace_names if ns not in priority_namespaces]
+        # 🏷️ 2. Découvrir le déploiement associé (en parallèle des events)
+        deployment_name, events = await asyncio.gather(
+            _discover_deployment_from_pod(apps_v1, pod),
+            _get_pod_events(v1, namespace_name, pod_name)
+        )
+        deployment_context = {}
         
-        for namespace_name in search_order:
-            if namespace_name not in namespace_names:
-                continue
-                
-            discovery_info["searched_namespaces"].append(namespace_name)
-            
-            try:
-                # 🔍 2. Chercher le pod dans ce namespace
-                pod = v1.read_namespaced_pod(name=pod_name, namespace=namespace_name)
-                
-                logger.info(f"✅ Found pod {pod_name} in namespace {namespace_name}")
-                discovery_info["found_namespace"] = namespace_name
-                
-                # 🏷️ 3. Découvrir le déploiement associé
-                deployment_name = _discover_deployment_from_pod(apps_v1, pod)
-                deployment_context = {}
-                
-                if deployment_name:
-                    discovery_info["found_deployment"] = deployment_name
-                    deployment_context = _get_deployment_context(apps_v1, namespace_name, deployment_name)
-                
-                # 📦 4. Construire le contexte complet
-                return {
-                    "pod": _format_pod_info(pod, discovered=True),
-                    "deployment": deployment_context,
-                    "events": _get_pod_events(v1, namespace_name, pod_name),
-                    "discovery_info": discovery_info
-                }
-                
-            except client.exceptions.ApiException:
-                continue  # Pod pas dans ce namespace
-        
-        # ❌ Pod non trouvé dans aucun namespace
-        logger.warning(f"❌ Pod {pod_name} not found in any namespace")
-        return {
-            "pod": {"error": f"Pod {pod_name} not found in any namespace"},
-            "deployment": {"error": "Cannot find deployment without valid pod"},
-            "events": [],
-            "discovery_info": discovery_info
-        }
+        if deployment_name:
+            discovery_info["found_deployment"] = deployment_name
+            deployment_context = await _get_deployment_context(apps_v1, namespace_name, deployment_name)
         
-    except Exception as e:
-        logger.error(f"❌ Error during automatic discovery: {e}")
+        # 📦 3. Construire le contexte complet
         return {
-            "pod": {"error": f"Discovery failed: {str(e)}"},
-            "deployment": {"error": "Discovery failed"},
-            "events": [],
+            "pod": _format_pod_info(pod, discovered=True),
+            "deployment": deployment_context,
+            "events": events,
             "discovery_info": discovery_info
         }
+    
+    # ❌ Pod non trouvé dans aucun namespace
+    logger.warning(f"❌ Pod {pod_name} not found in any namespace")
+    return {
+        "pod": {"error": f"Pod {pod_name} not found in any namespace"},
+        "deployment": {"error": "Cannot find deployment without valid pod"},
+        "events": [],
+        "discovery_info": discovery_info
+    }
+
+def _pod_creation_key(pod):
+    """Clé de tri par date de création (les pods sans date passent en dernier)"""
+    created = pod.metadata.creation_timestamp
+    return created.timestamp() if created else float("-inf")
+
+async def _list_namespace_names(v1) -> list:
+    """Noms des namespaces du cluster (changent rarement: mis en cache une minute)"""
+    namespace_names = _namespace_names_cache.get("names")
+    if namespace_names is None:
+        response = await v1.list_namespace(_preload_content=False, _request_timeout=K8S_REQUEST_TIMEOUT)
+        namespaces = await _read_json(response)
+        namespace_names = [item["metadata"]["name"] for item in namespaces.get("items", [])]
+        _namespace_names_cache["names"] = namespace_names
+    return namespace_names
 
-def _discover_deployment_from_pod(apps_v1, pod) -> str | None:
+async def _find_pod_in_namespaces(v1, pod_name: str, discovery_info: dict):
     """
-    Découvre le déploiement associé à un pod en analysant ses labels/owner references
+    Cherche un pod namespace par namespace, en parallèle borné
+    Retourne le premier pod trouvé (les requêtes restantes sont annulées) ou None
     """
+    namespace_names = await _list_namespace_names(v1)
+    discovery_info["searched_namespaces"] = namespace_names
+    
+    # 🚦 Borne le nombre de requêtes simultanées vers l'API server
+    semaphore = asyncio.Semaphore(NAMESPACE_SCAN_CONCURRENCY)
+    
+    async def _try_namespace(namespace_name: str):
+        async with semaphore:
+            try:
+                return await v1.read_namespaced_pod(name=pod_name, namespace=namespace_name, _request_timeout=K8S_REQUEST_TIMEOUT)
+            except client.exceptions.ApiException as e:
+                if e.status != 404:
+                    logger.debug(f"🔍 Could not read pod {pod_name} in {namespace_name}: {e}")
+                return None
+    
+    tasks = [asyncio.create_task(_try_namespace(ns)) for ns in namespace_names]
     try:
+        for next_done in asyncio.as_completed(tasks):
+            pod = await next_done
+            if pod:
+                return pod
+        return None
+    finally:
+        # Premier trouvé (ou annulation de l'appelant): on arrête les autres requêtes
+        for task in tasks:
+            task.cancel()
+
+async def _discover_deployment_from_pod(apps_v1, pod) -> str | None:
+    """
+    Découvre le déploiement associé à un pod (résultat mis en cache par uid du pod)
+    """
+    pod_uid = pod.metadata.uid
+    cached = _pod_deployment_cache.get(pod_uid) if pod_uid else None
+    if cached:
+        return cached
+    
+    deployment_name = await _resolve_deployment_from_pod(apps_v1, pod)
+    if deployment_name and pod_uid:
+        _pod_deployment_cache[pod_uid] = deployment_name
+    return deployment_name
+
+async def _resolve_deployment_from_pod(apps_v1, pod) -> str | None:
+    """
+    Résout le déploiement associé à un pod en analysant ses labels/owner references
+    """
+    try:
+        namespace = pod.metadata.namespace
+        
         # 🏷️ Méthode 1: Owner References (le plus fiable)
         if pod.metadata.owner_references:
             for owner in pod.metadata.owner_references:
                 if owner.kind == "ReplicaSet":
                     # Le ReplicaSet appartient généralement à un Deployment
                     rs_name = owner.name
-                    namespace = pod.metadata.namespace
+                    cache_key = (namespace, rs_name)
+                    if cache_key in _replicaset_owner_cache:
+                        deployment_name = _replicaset_owner_cache[cache_key]
+                        if deployment_name:
+                            return deployment_name
+                        continue
                     
                     try:
-                        rs = apps_v1.read_namespaced_replica_set(name=rs_name, namespace=namespace)
-                        if rs.metadata.owner_references:
-                            for rs_owner in rs.metadata.owner_references:
-                                if rs_owner.kind == "Deployment":
-                                    logger.info(f"🎯 Found deployment {rs_owner.name} via ReplicaSet")
-                                    return rs_owner.name
+                        rs = await apps_v1.read_namespaced_replica_set(name=rs_name, namespace=namespace, _request_timeout=K8S_REQUEST_TIMEOUT)
+                        deployment_name = next(
+                            (rs_owner.name for rs_owner in rs.metadata.owner_references or [] if rs_owner.kind == "Deployment"),
+                            None
+                        )
+                        _replicaset_owner_cache[cache_key] = deployment_name
+                        if deployment_name:
+                            logger.info(f"🎯 Found deployment {deployment_name} via ReplicaSet")
+                            return deployment_name
                     except client.exceptions.ApiException as e:
                         logger.warning(f"⚠️ Could not read ReplicaSet {rs_name}: {e}")
                         continue
@@ -168,25 +323,26 @@ def _discover_deployment_from_pod(apps_v1, pod) -> str | None:
         # 🏷️ Méthode 2: Labels (fallback)
         if pod.metadata.labels:
             # Chercher des labels communs de déploiement
-            deployment_labels = [
-                "app.kubernetes.io/name",
-                "app",
-                "k8s-app"
+            candidates = [
+                (label_key, pod.metadata.labels[label_key])
+                for label_key in DEPLOYMENT_NAME_LABELS
+                if label_key in pod.metadata.labels
             ]
             
-            for label_key in deployment_labels:
-                if label_key in pod.metadata.labels:
-                    app_name = pod.metadata.labels[label_key]
-                    namespace = pod.metadata.namespace
-                    
-                    try:
-                        # Vérifier si un déploiement avec ce nom existe
-                        deployment = apps_v1.read_namespaced_deployment(name=app_name, namespace=namespace)
-                        logger.info(f"🎯 Found deployment {app_name} via label {label_key}")
-                        return app_name
-                    except client.exceptions.ApiException as e:
-                        logger.debug(f"🔍 Deployment {app_name} not found via label {label_key}: {e}")
-                        continue
+            # GET par nom dans l'ordre de priorité des labels (pas de list: moins de données
+            # et seul le droit get est requis); un nom déjà essayé n'est pas redemandé
+            tried = set()
+            for label_key, app_name in candidates:
+                if app_name in tried:
+                    continue
+                tried.add(app_name)
+                try:
+                    # Vérifier si un déploiement avec ce nom existe
+                    await apps_v1.read_namespaced_deployment(name=app_name, namespace=namespace, _request_timeout=K8S_REQUEST_TIMEOUT)
+                    logger.info(f"🎯 Found deployment {app_name} via label {label_key}")
+                    return app_name
+                except client.exceptions.ApiException as e:
+                    logger.debug(f"🔍 Deployment {app_name} not found via label {label_key}: {e}")
         
         logger.warning(f"⚠️ Could not discover deployment for pod {pod.metadata.name}")
         return None
@@ -195,51 +351,86 @@ def _discover_deployment_from_pod(apps_v1, pod) -> str | None:
         logger.error(f"❌ Error discovering deployment: {e}")
         return None
 
-def _get_pod_context_with_fallback(v1, namespace: str, pod_name: str | None) -> dict:
-    """Get pod context with fallback strategies"""
+async def _get_pod_and_discovered_deployment(v1, apps_v1, namespace: str, pod_name: str | None, discover: bool) -> tuple[dict, dict]:
+    """
+    Récupère le pod puis, si demandé, découvre son deployment à partir du pod déjà lu
+    (pas de second GET sur le pod)
+    """
+    pod, pod_context = await _get_pod_context_with_fallback(v1, namespace, pod_name)
+    if pod is None or not discover:
+        return pod_context, {}
+    
+    try:
+        discovered_deployment = await _discover_deployment_from_pod(apps_v1, pod)
+        if discovered_deployment:
+            deployment_context = await _get_deployment_context(apps_v1, pod.metadata.namespace, discovered_deployment)
+            logger.info(f"🎯 Auto-discovered deployment: {discovered_deployment}")
+            return pod_context, deployment_context
+        return pod_context, {"error": "No deployment found for this pod"}
+    except Exception as e:
+        logger.error(f"❌ Error discovering deployment: {e}")
+        return pod_context, {"error": f"Discovery failed: {str(e)}"}
+
+async def _get_pod_context_with_fallback(v1, namespace: str, pod_name: str | None) -> tuple:
+    """Get pod context with fallback strategies, as (pod object or None, formatted context)"""
     if not pod_name:
-        return {"error": "No pod name provided"}
+        return None, {"error": "No pod name provided"}
     
     try:
-        pod = v1.read_namespaced_pod(name=pod_name, namespace=namespace)
-        return _format_pod_info(pod)
+        pod = await v1.read_namespaced_pod(name=pod_name, namespace=namespace, _request_timeout=K8S_REQUEST_TIMEOUT)
+        return pod, _format_pod_info(pod)
     except client.exceptions.ApiException as e:
         if e.status == 404:
             logger.warning(f"⚠️ Pod {pod_name} not found in namespace {namespace}")
             # 🔍 Fallback: recherche par pattern dans le namespace
-            return _search_pod_by_pattern(v1, namespace, pod_name)
+            return await _search_pod_by_pattern(v1, namespace, pod_name)
         else:
             logger.error(f"❌ Error retrieving pod: {e}")
-            return {"error": f"API error: {e}"}
+            return None, {"error": f"API error: {e}"}
 
-def _search_pod_by_pattern(v1, namespace: str, pod_name: str) -> dict:
+async def _search_pod_by_pattern(v1, namespace: str, pod_name: str) -> tuple:
     """Search pods by name pattern in a specific namespace"""
     try:
-        all_pods = v1.list_namespaced_pod(namespace=namespace)
+        # ⚡ JSON brut: on évite de construire un V1Pod complet pour chaque pod du namespace
+        response = await v1.list_namespaced_pod(namespace=namespace, _preload_content=False, _request_timeout=K8S_REQUEST_TIMEOUT)
+        all_pods = await _read_json(response)
         
-        # 🎯 Recherche par pattern (contient le nom)
-        matching_pods = []
-        for pod in all_pods.items:
-            if pod_name in pod.metadata.name:
-                matching_pods.append(pod)
+        # 🎯 Recherche par pattern (contient le nom) et sélection du plus récent en une seule passe
+        # (les dates ISO-8601 se comparent en tant que chaînes)
+        latest = max(
+            (item["metadata"] for item in all_pods.get("items", []) if pod_name in item["metadata"]["name"]),
+            key=lambda m: m.get("creationTimestamp", ""),
+            default=None
+        )
         
-        if matching_pods:
-            # Prendre le plus récent
-            latest_pod = max(matching_pods, key=lambda p: p.metadata.creation_timestamp)
+        if latest:
+            latest_pod = await v1.read_namespaced_pod(name=latest["name"], namespace=namespace, _request_timeout=K8S_REQUEST_TIMEOUT)
             result = _format_pod_info(latest_pod)
             result["warning"] = f"Exact pod not found, using similar: {latest_pod.metadata.name}"
             logger.info(f"🔍 Found similar pod: {latest_pod.metadata.name}")
-            return result
+            return latest_pod, result
             
-        return {"error": f"No pods matching pattern '{pod_name}' found in {namespace}"}
+        return None, {"error": f"No pods matching pattern '{pod_name}' found in {namespace}"}
         
     except Exception as e:
-        return {"error": f"Pattern search failed: {str(e)}"}
+        return None, {"error": f"Pattern search failed: {str(e)}"}
+
+async def _read_json(response) -> dict:
+    """Parse a raw (_preload_content=False) API response without building Swagger models"""
+    try:
+        if not 200 <= response.status <= 299:
+            raise client.exceptions.ApiException(status=response.status, reason=response.reason)
+        return orjson.loads(await response.read())
+    finally:
+        response.release()
 
 def _format_pod_info(pod, discovered: bool = False) -> dict:
     """Format pod information with optional discovery flag"""
+    # Une seule passe: liste des conteneurs et total des redémarrages
     container_statuses = []
+    total_restarts = 0
     for c in pod.status.container_statuses or []:
+        total_restarts += c.restart_count
         last_state = "None"
         if c.last_state.terminated:
             last_state = f"Terminated({c.last_state.terminated.reason})"
@@ -254,7 +445,7 @@ def _format_pod_info(pod, discovered: bool = False) -> dict:
         "name": pod.metadata.name,
         "namespace": pod.metadata.namespace,
         "status": pod.status.phase,
-        "restarts": sum(cs.restart_count for cs in pod.status.container_statuses or []),
+        "restarts": total_restarts,
         "container_statuses": container_statuses
     }
     
@@ -263,9 +454,14 @@ def _format_pod_info(pod, discovered: bool = False) -> dict:
     
     return result
 
-def _get_deployment_context(apps_v1, namespace: str, deployment_name: str) -> dict:
+async def _get_deployment_context(apps_v1, namespace: str, deployment_name: str) -> dict:
+    cache_key = (namespace, deployment_name)
+    cached = _deployment_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    
     try:
-        deployment = apps_v1.read_namespaced_deployment(name=deployment_name, namespace=namespace)
+        deployment = await apps_v1.read_namespaced_deployment(name=deployment_name, namespace=namespace, _request_timeout=K8S_REQUEST_TIMEOUT)
         resources = {}
         if deployment.spec.template.spec.containers:
             c = deployment.spec.template.spec.containers[0]
@@ -274,26 +470,34 @@ def _get_deployment_context(apps_v1, namespace: str, deployment_name: str) -> di
                     "requests": c.resources.requests or {},
                     "limits": c.resources.limits or {}
                 }
-        return {
+        deployment_context = {
             "name": deployment.metadata.name,
             "replicas": deployment.spec.replicas,
             "ready_replicas": deployment.status.ready_replicas or 0,
             "resources": resources
         }
+        _deployment_cache[cache_key] = deployment_context
+        return deployment_context
     except client.exceptions.ApiException as e:
         logger.error(f"❌ Error retrieving deployment: {e}")  # Utiliser logger au lieu de print
         return {}
 
-def _get_pod_events(v1, namespace: str, pod_name: str) -> list:
+async def _get_pod_events(v1, namespace: str, pod_name: str) -> list:
     try:
-        events = v1.list_namespaced_event(namespace=namespace, field_selector=f"involvedObject.name={pod_name}")
+        response = await v1.list_namespaced_event(
+            namespace=namespace,
+            field_selector=f"involvedObject.name={pod_name}",
+            _preload_content=False,
+            _request_timeout=K8S_REQUEST_TIMEOUT
+        )
+        events = await _read_json(response)
         return [
             {
-                "type": event.type,
-                "reason": event.reason,
-                "message": event.message
+                "type": event.get("type"),
+                "reason": event.get("reason"),
+                "message": event.get("message")
             }
-            for event in events.items
+            for event in events.get("items", [])
         ]
     except client.exceptions.ApiException as e:
         logger.error(f"❌ Error retrieving events: {e}")  # Utiliser logger au lieu de print
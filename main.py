@@ -1,17 +1,24 @@
 import os
+import atexit
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from typing import Dict, Any
 from dotenv import load_dotenv
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+import orjson
+from cachetools import TTLCache
 import datetime
 import asyncio
 import hashlib
 import time
 from contextlib import asynccontextmanager
+from functools import lru_cache
 
 # Import our custom modules
-from external_resource_service import datadog_manager, AlertDatabase, AlertStatus, get_k8s_context
+from external_resource_service import datadog_manager, k8s_manager, AlertDatabase, AlertStatus, get_k8s_context
+from external_resource_service.database import PENDING_ALERT_DELAY
 from decision import ReasoningEngine
 
 
@@ -20,6 +27,13 @@ logging.basicConfig(
     level=logging.DEBUG if os.getenv("ENVIRONMENT", "local") == "local" else logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
+# 📤 Les logs sont mis en file sur la boucle; l'écriture sur stderr se fait dans le thread du listener
+_log_queue = queue.SimpleQueue()
+_log_listener = QueueListener(_log_queue, *logging.root.handlers, respect_handler_level=True)
+logging.root.handlers = [QueueHandler(_log_queue)]
+_log_listener.start()
+# Vide la file de logs à la sortie du process (le lifespan peut redémarrer dans le même process)
+atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 
 db: AlertDatabase | None = None
@@ -30,10 +44,29 @@ if os.getenv("ENVIRONMENT", "local") == "local":
     logger.info("⚙️ Loading .env.dev for local development")
     load_dotenv(dotenv_path=".env.dev")
 
+# 🔁 Cache local des alertes déjà enregistrées: les doublons en rafale ne touchent plus la base
+ALERT_DEDUP_TTL = int(os.getenv("ALERT_DEDUP_TTL", "3600"))
+_recent_alerts = TTLCache(maxsize=10000, ttl=ALERT_DEDUP_TTL)
+
+# 🚦 Enrichissements simultanés max (API Datadog limitée en débit): le worker traite un lot
+# à la fois, la taille du lot borne donc la concurrence
+MAX_CONCURRENT_ENRICH = int(os.getenv("MAX_CONCURRENT_ENRICH", "10"))
+ALERT_WORKER_BATCH_SIZE = MAX_CONCURRENT_ENRICH
+
+# 🔔 Le worker est réveillé quand une alerte acceptée devient éligible; le polling ne sert
+# plus que de filet (alertes reçues par une autre instance, redémarrage)
+ALERT_WORKER_POLL_INTERVAL = 30
+# Un seul minuteur de réveil en attente: pendant une rafale il est ré-armé à cet intervalle
+# tant que des alertes enregistrées ne sont pas encore éligibles
+ALERT_WAKE_INTERVAL = 1.0
+_alerts_ready = asyncio.Event()
+_wake_handle: asyncio.TimerHandle | None = None
+_last_alert_saved = 0.0
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager"""
-    global db, reasoning_engine
+    global db, reasoning_engine, _wake_handle
     
     # Startup
     logger.info("🚀 Starting K-Fix application")
@@ -43,6 +76,10 @@ async def lifespan(app: FastAPI):
         await db.initialize()
         logger.info("✅ Database initialized")
         
+        # Initialize Datadog client (config lue une fois: des clés manquantes échouent au démarrage)
+        datadog_manager.get_events_api()
+        logger.info("✅ Datadog client initialized")
+        
         # Initialize reasoning engine
         reasoning_engine = ReasoningEngine()
         logger.info("🧠 Reasoning engine initialized")
@@ -58,9 +95,18 @@ async def lifespan(app: FastAPI):
     finally:
         # Shutdown
         logger.info("🛑 Shutting down K-Fix application")
+        if _wake_handle:
+            _wake_handle.cancel()
+            _wake_handle = None
         if datadog_manager:
-            datadog_manager.close()
+            await datadog_manager.close()
+        await k8s_manager.close()
+        if db:
+            # Écrit les mises à jour de statut encore en file avant de fermer le pool
+            await db.close()
         # Clean up reasoning engine if needed
+        if reasoning_engine:
+            await reasoning_engine.llm_client.close()
         reasoning_engine = None
         logger.info("✅ Application shutdown complete")
 
@@ -68,7 +114,8 @@ app = FastAPI(
     title="K-Fix Datadog Webhook",
     description="Service to enrich Datadog alerts with Kubernetes context",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 def _extract_k8s_info_from_tags(tags: list) -> tuple[str, str | None, str | None]:
@@ -78,12 +125,16 @@ def _extract_k8s_info_from_tags(tags: list) -> tuple[str, str | None, str | None
     deployment = None
     
     for tag in tags:
-        if tag.startswith("pod_name:"):
-            pod_name = tag.split(":", 1)[1]
-        elif tag.startswith("kube_namespace:"):
-            namespace = tag.split(":", 1)[1]
-        elif tag.startswith("kube_deployment:"):
-            deployment = tag.split(":", 1)[1]
+        # Un seul découpage par tag, puis comparaison de la clé
+        key, sep, value = tag.partition(":")
+        if not sep:
+            continue
+        if key == "pod_name":
+            pod_name = value
+        elif key == "kube_namespace":
+            namespace = value
+        elif key == "kube_deployment":
+            deployment = value
     
     return pod_name, namespace, deployment
 
@@ -97,7 +148,8 @@ def _validate_payload(payload: Dict[str, Any]) -> None:
 def _generate_alert_hash(payload: Dict[str, Any]) -> str:
     """Generate a unique hash for the alert to prevent duplicates"""
     alert_data = f"{payload.get('id', '')}-{payload.get('eventType', '')}-{payload.get('date', '')}"
-    return hashlib.md5(alert_data.encode()).hexdigest()
+    # Clé de déduplication (pas de sécurité): blake2b 128 bits, même format 32 hex que l'ancien md5
+    return hashlib.blake2b(alert_data.encode(), digest_size=16).hexdigest()
 
 async def _process_alert_async(payload: Dict[str, Any], alert_hash: str):
     """Process alert asynchronously with enrichment"""
@@ -106,15 +158,27 @@ async def _process_alert_async(payload: Dict[str, Any], alert_hash: str):
         return
     
     try:
-        # Update status to processing
-        await db.update_alert_status(alert_hash, AlertStatus.PROCESSING)
+        # Statut 'processing' déjà posé par claim_pending_alerts
         logger.info(f"🔄 Processing alert {alert_hash[:8]}")
         
         # Get runtime event details
         event_id = payload.get("event_id")
         if event_id:
             try:
-                event_details = await datadog_manager.get_runtime_event(int(event_id))
+                # Si le webhook porte déjà des tags K8s, le contexte K8s est récupéré
+                # en parallèle de l'événement Datadog (spéculatif)
+                hint = _extract_k8s_info_from_tags(payload.get("tags") or [])
+                speculative_context = None
+                if hint[0]:
+                    event_details, speculative_context = await asyncio.gather(
+                        datadog_manager.get_runtime_event(int(event_id)),
+                        get_k8s_context(hint[1], hint[0], hint[2]),
+                        return_exceptions=True
+                    )
+                    if isinstance(event_details, BaseException):
+                        raise event_details
+                else:
+                    event_details = await datadog_manager.get_runtime_event(int(event_id))
                 logger.info(f"📊 Retrieved event details for {event_id}")
                 
                 # Extract K8s info from tags
@@ -122,8 +186,11 @@ async def _process_alert_async(payload: Dict[str, Any], alert_hash: str):
                 pod_name, namespace, deployment = _extract_k8s_info_from_tags(tags)
                 
                 if pod_name:
-                    # Get Kubernetes context
-                    k8s_context = await get_k8s_context(namespace, pod_name, deployment)  # ✅ Ajouter await
+                    # Get Kubernetes context (réutilise le résultat spéculatif s'il vise le même pod)
+                    if (pod_name, namespace, deployment) == hint and isinstance(speculative_context, dict):
+                        k8s_context = speculative_context
+                    else:
+                        k8s_context = await get_k8s_context(namespace, pod_name, deployment)  # ✅ Ajouter await
                     
                     # Combine all information
                     enriched_data = {
@@ -155,6 +222,20 @@ async def _process_alert_async(payload: Dict[str, Any], alert_hash: str):
         logger.error(f"❌ Failed to process alert {alert_hash}: {e}")
         await db.update_alert_status(alert_hash, AlertStatus.FAILED)
 
+async def _process_pending_alert(alert: Dict[str, Any]):
+    """Process one queued alert (concurrency bounded by the worker batch size)"""
+    try:
+        alert_hash = alert["alert_hash"]  # ✅ Corriger l'accès
+        payload = alert["payload"]
+        
+        # Process the alert
+        await _process_alert_async(payload, alert_hash)
+        
+    except Exception as e:
+        logger.error(f"❌ Failed to process alert {alert['alert_hash'][:8]}: {e}")
+        if db:
+            await db.update_alert_status(alert["alert_hash"], AlertStatus.FAILED)  # ✅ Ajouter await et corriger
+
 async def _alert_worker():
     """Background worker to process alerts from the queue"""
     if not db:
@@ -166,47 +247,81 @@ async def _alert_worker():
     while True:
         try:
             # Get pending alerts
-            pending_alerts = await db.get_pending_alerts()
+            _alerts_ready.clear()
+            # Réservation atomique: une autre instance ne reprendra pas ces alertes
+            pending_alerts = await db.claim_pending_alerts(limit=ALERT_WORKER_BATCH_SIZE)
             
             if pending_alerts:
                 logger.info(f"📋 Processing {len(pending_alerts)} pending alerts")
                 
-                for alert in pending_alerts:
-                    try:
-                        alert_hash = alert["alert_hash"]  # ✅ Corriger l'accès
-                        payload = alert["payload"]
-                        
-                        # Process the alert
-                        await _process_alert_async(payload, alert_hash)
-                        
-                    except Exception as e:
-                        logger.error(f"❌ Failed to process alert {alert['alert_hash'][:8]}: {e}")
-                        if db:
-                            await db.update_alert_status(alert["alert_hash"], AlertStatus.FAILED)  # ✅ Ajouter await et corriger
+                # ⚡ Les alertes attendent surtout Datadog/K8s/LLM: traitées en parallèle, concurrence bornée
+                await asyncio.gather(*(_process_pending_alert(alert) for alert in pending_alerts))
+                
+                # Statuts écrits avant la prochaine requête: le lot traité n'est pas relu
+                await db.flush_updates()
+                if len(pending_alerts) == ALERT_WORKER_BATCH_SIZE:
+                    # Lot plein: il reste sans doute des alertes en attente
+                    continue
             
-            # Wait before checking again
-            await asyncio.sleep(5)
+            # Attendre la prochaine alerte éligible (ou le polling de secours)
+            try:
+                await asyncio.wait_for(_alerts_ready.wait(), timeout=ALERT_WORKER_POLL_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
             
         except Exception as e:
             logger.error(f"❌ Alert worker error: {e}")
             await asyncio.sleep(10)
 
+@lru_cache(maxsize=1)
+def _iso_timestamp(epoch_second: int) -> str:
+    """UTC ISO-8601 timestamp, formatted once per second (probes de santé en rafale)"""
+    return datetime.datetime.fromtimestamp(epoch_second, datetime.timezone.utc).isoformat()
+
 #Endpoints
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
     return {
         "status": "healthy",
-        "timestamp": datetime.datetime.now().isoformat(),
+        "timestamp": _iso_timestamp(int(time.time())),
         "database": db is not None,
         "datadog": datadog_manager.is_connected() if datadog_manager else False
     }
 
+def _duplicate_response(alert_hash: str) -> ORJSONResponse:
+    """Response returned for an alert that was already received"""
+    return ORJSONResponse(
+        status_code=200,
+        content={
+            "status": "duplicate",
+            "message": "Alert already processed",
+            "alert_hash": alert_hash
+        }
+    )
+
+def _schedule_worker_wakeup():
+    """Réveille le worker quand l'alerte enregistrée devient éligible (+1s de marge d'horloge)"""
+    global _wake_handle, _last_alert_saved
+    loop = asyncio.get_running_loop()
+    _last_alert_saved = loop.time()
+    if _wake_handle is None:
+        _wake_handle = loop.call_later(PENDING_ALERT_DELAY + 1, _wake_worker)
+
+def _wake_worker():
+    """Callback du minuteur: réveille le worker, ré-armé si des alertes plus récentes attendent"""
+    global _wake_handle
+    _alerts_ready.set()
+    loop = asyncio.get_running_loop()
+    remaining = _last_alert_saved + PENDING_ALERT_DELAY + 1 - loop.time()
+    _wake_handle = loop.call_later(min(remaining, ALERT_WAKE_INTERVAL), _wake_worker) if remaining > 0 else None
+
 @app.post("/datadog-webhook")
 async def datadog_webhook(request: Request):
     """Handle incoming Datadog webhooks"""
     try:
-        payload = await request.json()
+        body = await request.body()
+        payload = orjson.loads(body)
         logger.info(f"📨 Received webhook: {payload.get('event_id', 'unknown')}")
         
         # Validate payload
@@ -215,27 +330,33 @@ async def datadog_webhook(request: Request):
         # Generate alert hash for deduplication
         alert_hash = _generate_alert_hash(payload)
         
-        # Check if we've already processed this alert
-        if db and await db.is_alert_received(alert_hash):  # ✅ Ajouter await
+        # ⚡ Doublon récent connu de ce process: réponse immédiate, sans aller-retour base
+        if alert_hash in _recent_alerts:
             logger.info(f"🔄 Alert {alert_hash} already exists, skipping")
-            return JSONResponse(
-                status_code=200,
-                content={
-                    "status": "duplicate",
-                    "message": "Alert already processed",
-                    "alert_hash": alert_hash
-                }
-            )
+            return _duplicate_response(alert_hash)
         
-        # ✅ SAUVEGARDER l'alert dans la base
+        # Réservé tout de suite: les rafales concurrentes du même webhook sont dédupliquées ici
+        _recent_alerts[alert_hash] = True
+        
+        # ✅ SAUVEGARDER l'alert dans la base avant de répondre: Datadog ne renvoie pas
+        # un webhook accepté (202). L'INSERT ... ON CONFLICT reste l'arbitre des doublons entre instances
         if db:
-            await db.save_alert(payload, alert_hash)
+            try:
+                saved = await db.save_alert(payload, alert_hash, raw_payload=body)
+            except Exception:
+                # Pas enregistrée: on libère le hash pour que le renvoi du webhook soit accepté
+                _recent_alerts.pop(alert_hash, None)
+                raise
+            if saved is None:
+                logger.info(f"🔄 Alert {alert_hash} already exists, skipping")
+                return _duplicate_response(alert_hash)
             logger.info(f"💾 Alert {alert_hash[:8]} saved to database")
+            _schedule_worker_wakeup()
         
         # Queue the alert for processing
         logger.info(f"📥 Queuing alert {alert_hash} for processing")
         
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=202,
             content={
                 "status": "accepted",
@@ -257,11 +378,11 @@ async def queue_status():
     
     try:
         pending_alerts = await db.get_pending_alerts()  # ✅ Ajouter await
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=200,
             content={
                 "pending_alerts": len(pending_alerts),
-                "timestamp": datetime.datetime.now().isoformat()
+                "timestamp": _iso_timestamp(int(time.time()))
             }
         )
     except Exception as e:
@@ -276,7 +397,7 @@ async def cleanup_old_alerts(days: int = 30):
     
     try:
         deleted_count = await db.cleanup_old_alerts(days)  # ✅ Ajouter await
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=200,
             content={
                 "message": f"Cleaned up {deleted_count} alerts older than {days} days",